@@ -0,0 +1,94 @@
+"""
+複数のコンポーネントの情報を1件ずつtoolで取得した場合と、
+`get_softreef_component_descriptions`でまとめて取得した場合の所要時間を比較する。
+ローカルのstorybookからMDXを静的に取得するため、ブラウザは利用しない。
+
+    SOFTREEF_DESIGN_SYSTEM_FILE_BASE_PATH=/tmp uv run benchmarks/bench_batch_descriptions.py --copies 4 --latency 0.1
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+# 計測ごとに描画し直すため、ディスクキャッシュは使わない
+os.environ["SOFTREEF_DISK_CACHE"] = "0"
+
+from storybook_fixture import COMPONENTS, FixtureOptions, StorybookFixture
+from storybook_resources import Resource, uri_2_resource
+from markdown_cache import markdown_cache
+from storybook_static_fetcher import static_storybook
+from storybook_server import call_tool
+
+PREFIX = "markdown://softreef/design-system/component/"
+
+
+def register_fixture_components(fixture: StorybookFixture, copies: int) -> list[str]:
+    # 同じdocsを別のURIとして複数登録し、single-flightで共有されない取得を増やす
+    names = []
+    for copy in range(copies):
+        for component in COMPONENTS:
+            name = f"Bench{component}{copy}"
+            uri_2_resource[f"{PREFIX}{name}"] = Resource(
+                url=fixture.manager_url(component),
+                name=name,
+                description=f"{component} (benchmark)",
+            )
+            names.append(name)
+    return names
+
+
+async def sequential(names: list[str]) -> list[str]:
+    texts = []
+    for name in names:
+        try:
+            result = await call_tool(
+                "get_softreef_component_description", {"component": name}
+            )
+            texts.append(result[0].text)
+        except Exception as e:
+            texts.append(f"Error: {str(e)}")
+    return texts
+
+
+async def batch(names: list[str]) -> list[str]:
+    result = await call_tool(
+        "get_softreef_component_descriptions", {"components": names}
+    )
+    return [content.text for content in result]
+
+
+async def run(copies: int, latency: float):
+    options = FixtureOptions(mdx_doc_blocks=False, source_delay=latency)
+    with StorybookFixture(options) as fixture:
+        names = register_fixture_components(fixture, copies)
+        # 存在しない項目はその項目だけエラーになる
+        names.append("NotExistingComponent")
+        # index.jsonの取得は計測から除く
+        resource = uri_2_resource[f"{PREFIX}{names[0]}"]
+        await static_storybook.index(static_storybook.base_url(resource))
+
+        try:
+            for label, fetch in [("sequential", sequential), ("batch", batch)]:
+                markdown_cache.clear()
+                started = time.perf_counter()
+                texts = await fetch(names)
+                elapsed = time.perf_counter() - started
+                errors = sum(1 for text in texts if "Error: " in text)
+                print(
+                    f"{label:10} {len(names)} items in {elapsed * 1000:8.1f}ms "
+                    f"({errors} errors)"
+                )
+        finally:
+            await static_storybook.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=4)
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="MDXの応答に加える遅延（秒）"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.copies, args.latency))
@@ -0,0 +1,49 @@
+"""
+docsの大きさを変えながら、cursorの位置からchunkを切り出す時間を比較する。
+naiveは呼び出しごとに全体をencodeしてから切り出し、chunkedはキャッシュしたbytesをmemoryviewで切り出す。
+
+    uv run benchmarks/bench_chunked_documents.py --chunk-bytes 40000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from chunked_documents import ChunkedDocuments
+
+
+def naive_chunk(text: str, start: int, size: int) -> str:
+    return text.encode("utf-8")[start : start + size].decode("utf-8", errors="ignore")
+
+
+def measure(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def run(chunk_bytes: int, iterations: int):
+    for size_kb in [100, 1_000, 10_000]:
+        line = "ボタンのprops `size` は 'small' | 'medium' | 'large' を受け取る。\n"
+        text = line * (size_kb * 1024 // len(line.encode("utf-8")))
+        store = ChunkedDocuments()
+        cursor = store.chunk("doc", text, chunk_bytes).next_cursor
+
+        naive = measure(lambda: naive_chunk(text, chunk_bytes, chunk_bytes), iterations)
+        chunked = measure(
+            lambda: store.chunk("doc", text, chunk_bytes, cursor), iterations
+        )
+        print(
+            f"{size_kb:>6}KB naive={naive:10.1f}us/chunk chunked={chunked:8.1f}us/chunk"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-bytes", type=int, default=40000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    run(args.chunk_bytes, args.iterations)
@@ -0,0 +1,102 @@
+"""
+HTMLからmarkdownへの変換をevent loop上で行った場合とexecutorに逃がした場合で、
+変換中のevent loopの遅延を比較する。ブラウザは利用しない。
+
+    uv run benchmarks/bench_event_loop_lag.py --documents 20 --rows 400
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from storybook_fixture import COMPONENTS, docs_html
+import storybook_async_fetcher
+from storybook_async_fetcher import convert_html, html_to_markdown, shutdown_converter
+
+
+class EventLoopLagMonitor:
+    """
+    intervalごとにsleepし、予定より遅れて起きた時間をevent loopの遅延として記録する。
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - started - self.interval)
+
+    def __enter__(self) -> "EventLoopLagMonitor":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+    def summary(self) -> dict:
+        lags = sorted(self.lags) or [0.0]
+        return {
+            "p50_ms": statistics.median(lags) * 1000,
+            "p99_ms": lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000,
+            "max_ms": lags[-1] * 1000,
+        }
+
+
+async def convert_inline(documents: list[str]):
+    for html in documents:
+        html_to_markdown(html)
+        await asyncio.sleep(0)
+
+
+async def convert_in_executor(documents: list[str]):
+    await asyncio.gather(*[convert_html(html) for html in documents])
+
+
+async def run(documents: int, rows: int, workers: int):
+    storybook_async_fetcher.SOFTREEF_CONVERTER_WORKERS = workers
+    corpus = [
+        docs_html(COMPONENTS[i % len(COMPONENTS)], rows=rows, stories=rows // 10)
+        for i in range(documents)
+    ]
+    size_mb = sum(len(html.encode()) for html in corpus) / 1024 / 1024
+    print(f"{documents} documents, {size_mb:.1f}MB")
+
+    for name, convert, executor in [
+        ("inline", convert_inline, None),
+        ("thread", convert_in_executor, "thread"),
+        ("process", convert_in_executor, "process"),
+    ]:
+        if executor is not None:
+            shutdown_converter()
+            storybook_async_fetcher.SOFTREEF_CONVERTER_EXECUTOR = executor
+            # worker起動のコストは計測から除く
+            await convert_html(corpus[0])
+
+        started = time.perf_counter()
+        with EventLoopLagMonitor() as monitor:
+            await convert(corpus)
+        elapsed = time.perf_counter() - started
+        lag = monitor.summary()
+        print(
+            f"{name:8} total={elapsed * 1000:8.1f}ms "
+            f"lag p50={lag['p50_ms']:7.1f}ms p99={lag['p99_ms']:7.1f}ms "
+            f"max={lag['max_ms']:7.1f}ms"
+        )
+    shutdown_converter()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.documents, args.rows, args.workers))
@@ -0,0 +1,136 @@
+"""
+SSEで動かしたserverに複数のclientから同時に接続し、toolを呼び出した時のthroughputと応答時間を計測する。
+全てのclientが1つのserverのキャッシュを共有するため、最初に描画された後のdocsはキャッシュから返る。
+`--max-connections`より多いclientは接続を断られ、rejectedとして数える。
+ローカルのstorybookからMDXを静的に取得するため、ブラウザは利用しない。
+
+    SOFTREEF_DESIGN_SYSTEM_FILE_BASE_PATH=/tmp uv run benchmarks/bench_http_clients.py --clients 1 8 32 --calls 20
+"""
+import os
+import sys
+import time
+import socket
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+os.environ["SOFTREEF_DISK_CACHE"] = "0"
+
+import uvicorn
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from storybook_fixture import COMPONENTS, FixtureOptions, StorybookFixture
+from storybook_resources import Resource, uri_2_resource
+from markdown_cache import markdown_cache
+from storybook_static_fetcher import static_storybook
+from http_transport import SSE_PATH, ConnectionLimiter, create_app
+import storybook_server
+
+PREFIX = "markdown://softreef/design-system/component/"
+
+
+def register_fixture_components(fixture: StorybookFixture) -> list[str]:
+    names = []
+    for component in COMPONENTS:
+        name = f"Bench{component}"
+        uri_2_resource[f"{PREFIX}{name}"] = Resource(
+            url=fixture.manager_url(component),
+            name=name,
+            description=f"{component} (benchmark)",
+        )
+        names.append(name)
+    # mcpはtoolの引数をinputSchemaで検証するため、enumにも加える
+    storybook_server.component_names.extend(names)
+    return names
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def client(url: str, names: list[str], calls: int, latencies: list[float]) -> bool:
+    try:
+        async with sse_client(url) as streams, ClientSession(*streams) as session:
+            await session.initialize()
+            for _ in range(calls):
+                started = time.perf_counter()
+                result = await session.call_tool(
+                    "get_softreef_component_description",
+                    {"component": random.choice(names)},
+                )
+                if result.isError:
+                    raise RuntimeError(result.content[0].text)
+                latencies.append(time.perf_counter() - started)
+    except Exception:
+        return False
+    return True
+
+
+async def run(clients: list[int], calls: int, max_connections: int, concurrency: int):
+    options = FixtureOptions(mdx_doc_blocks=False, source_delay=0.1)
+    with StorybookFixture(options) as fixture:
+        names = register_fixture_components(fixture)
+        resource = uri_2_resource[f"{PREFIX}{names[0]}"]
+        await static_storybook.index(static_storybook.base_url(resource))
+
+        port = free_port()
+        limiter = ConnectionLimiter(max_connections, concurrency)
+        server = uvicorn.Server(
+            uvicorn.Config(
+                create_app(storybook_server.app, limiter),
+                host="127.0.0.1",
+                port=port,
+                log_level="error",
+                timeout_graceful_shutdown=1,
+            )
+        )
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        url = f"http://127.0.0.1:{port}{SSE_PATH}"
+        try:
+            for count in clients:
+                markdown_cache.clear()
+                rejected_before = limiter.rejected
+                latencies: list[float] = []
+                started = time.perf_counter()
+                results = await asyncio.gather(
+                    *[client(url, names, calls, latencies) for _ in range(count)]
+                )
+                elapsed = time.perf_counter() - started
+                latencies.sort()
+                p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+                print(
+                    f"{count:4} clients {len(latencies):5} calls in {elapsed:6.2f}s "
+                    f"{len(latencies) / elapsed:8.1f} calls/s "
+                    f"p50={statistics.median(latencies) * 1000:7.1f}ms "
+                    f"p99={p99 * 1000:7.1f}ms "
+                    f"failed={results.count(False)} "
+                    f"rejected={limiter.rejected - rejected_before}"
+                )
+                # 切断した接続の枠が空くことを確認する
+                for _ in range(100):
+                    if limiter.active == 0:
+                        break
+                    await asyncio.sleep(0.05)
+                assert limiter.active == 0, f"{limiter.active} connections were not released"
+        finally:
+            server.should_exit = True
+            await serving
+            await static_storybook.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--calls", type=int, default=20, help="1つのclientが呼び出す回数")
+    parser.add_argument("--max-connections", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.calls, args.max_connections, args.concurrency))
@@ -0,0 +1,64 @@
+"""
+managerのURLとiframe.htmlへの直接遷移でdocsの取得にかかる時間を比較する。
+
+    uv run benchmarks/bench_iframe_navigation.py --iterations 10
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from storybook_fixture import COMPONENTS, StorybookFixture
+from browser_manager import browser_manager, page_pool
+from storybook_async_fetcher import markdown_format_text
+
+
+async def measure(fixture: StorybookFixture, mode: str, iterations: int) -> dict:
+    latencies = []
+    fixture.reset_counters()
+    for i in range(iterations):
+        component = COMPONENTS[i % len(COMPONENTS)]
+        url = (
+            fixture.iframe_url(component)
+            if mode == "iframe"
+            else fixture.manager_url(component)
+        )
+        started = time.perf_counter()
+        markdown = await markdown_format_text(url=url)
+        latencies.append(time.perf_counter() - started)
+        assert component in markdown, f"{component} was not rendered"
+    return {
+        "mode": mode,
+        "median_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "kb_per_render": fixture.bytes_sent / iterations / 1024,
+    }
+
+
+async def run(iterations: int):
+    with StorybookFixture() as fixture:
+        try:
+            # 初回のChromium起動は計測から除く
+            await markdown_format_text(url=fixture.iframe_url(COMPONENTS[0]))
+            for mode in ["manager", "iframe"]:
+                result = await measure(fixture, mode, iterations)
+                print(
+                    f"mode={result['mode']:8} "
+                    f"median={result['median_ms']:8.1f}ms "
+                    f"max={result['max_ms']:8.1f}ms "
+                    f"transfer={result['kb_per_render']:8.1f}KB"
+                )
+        finally:
+            await page_pool.close()
+            await browser_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
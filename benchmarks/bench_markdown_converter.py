@@ -0,0 +1,102 @@
+"""
+HTMLからmarkdownへの変換について、1回の走査で変換するconverterと従来のBeautifulSoup+html2textを比較する。
+同じHTMLに対する両者の出力が行末の空白を除いて一致することを確認した上で、throughputとpeak memoryを表示する。
+corpusは`converter_corpus`に置いた`#storybook-docs`のHTMLと、fixtureで生成したdocsのHTML。
+入れ子のblockquoteやblockquote内のlistでは、html2textの出力（`>>`や余分な空行）とは揃えていない。
+
+    uv run benchmarks/bench_markdown_converter.py
+    uv run benchmarks/bench_markdown_converter.py --corpus path/to/captured_html_dir
+"""
+import os
+import sys
+import time
+import argparse
+import difflib
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from storybook_fixture import COMPONENTS, docs_html
+from storybook_async_fetcher import html_to_markdown
+
+
+CORPUS_DIRECTORY = Path(__file__).parent / "converter_corpus"
+
+
+def load_corpus(directory: str | None) -> dict[str, str]:
+    if directory is not None:
+        return {
+            path.name: path.read_text(encoding="utf-8")
+            for path in sorted(Path(directory).glob("*.html"))
+        }
+    return {
+        **load_corpus(str(CORPUS_DIRECTORY)),
+        **{
+            f"{component}-{rows}": docs_html(component, rows=rows, stories=rows // 5 + 1)
+            for component in COMPONENTS
+            for rows in [5, 40, 200]
+        },
+    }
+
+
+def normalize(markdown: str) -> list[str]:
+    return [line.rstrip() for line in markdown.split("\n")]
+
+
+def measure(converter: str, corpus: dict[str, str], repeat: int) -> dict:
+    size = sum(len(html.encode()) for html in corpus.values()) * repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in corpus.values():
+            html_to_markdown(html, converter=converter)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for html in corpus.values():
+        html_to_markdown(html, converter=converter)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "converter": converter,
+        "mb_per_s": size / 1024 / 1024 / elapsed,
+        "peak_kb": peak / 1024,
+    }
+
+
+def main(directory: str | None, repeat: int):
+    corpus = load_corpus(directory)
+    size_mb = sum(len(html.encode()) for html in corpus.values()) / 1024 / 1024
+    print(f"{len(corpus)} documents, {size_mb:.2f}MB")
+
+    mismatches = {}
+    for name, html in corpus.items():
+        expected = normalize(html_to_markdown(html, converter="html2text"))
+        actual = normalize(html_to_markdown(html, converter="single-pass"))
+        if actual != expected:
+            mismatches[name] = difflib.unified_diff(
+                expected, actual, "html2text", "single-pass", lineterm=""
+            )
+    print(f"golden: {len(corpus) - len(mismatches)}/{len(corpus)} documents match")
+    for name, diff in mismatches.items():
+        print(f"  mismatch: {name}")
+        for line in list(diff)[:20]:
+            print(f"    {line}")
+
+    for converter in ["html2text", "single-pass"]:
+        result = measure(converter, corpus, repeat)
+        print(
+            f"{result['converter']:12} "
+            f"throughput={result['mb_per_s']:7.2f}MB/s "
+            f"peak={result['peak_kb']:9.1f}KB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.corpus, args.repeat)
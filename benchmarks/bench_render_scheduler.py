@@ -0,0 +1,96 @@
+"""
+warm-upのprefetchが大量に積まれている間のinteractiveな描画の待ち時間を、
+FIFOの描画枠とRenderSchedulerで比較する。描画はsleepで模擬し、ブラウザは利用しない。
+
+    uv run benchmarks/bench_render_scheduler.py --prefetch 100 --interactive 50
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from render_scheduler import Priority, RenderScheduler, prioritized
+
+
+class FifoSlots:
+    """
+    優先度を区別しない従来の描画枠（page poolのFIFO）。
+    """
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    def slot(self):
+        return self.semaphore
+
+
+async def render(slots, render_ms: float):
+    async with slots.slot():
+        await asyncio.sleep(render_ms * random.uniform(0.5, 1.5) / 1000)
+
+
+async def prefetch(slots, count: int, render_ms: float):
+    async def job():
+        with prioritized(Priority.PREFETCH):
+            await render(slots, render_ms)
+
+    await asyncio.gather(*[job() for _ in range(count)])
+
+
+async def interactive(slots, count: int, interval_ms: float, render_ms: float):
+    latencies = []
+
+    async def job():
+        started = time.perf_counter()
+        with prioritized(Priority.INTERACTIVE):
+            await render(slots, render_ms)
+        latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    for _ in range(count):
+        tasks.append(asyncio.create_task(job()))
+        await asyncio.sleep(interval_ms / 1000)
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def run(args):
+    for name, slots in [
+        ("fifo", FifoSlots(args.concurrency)),
+        ("scheduler", RenderScheduler(args.concurrency, {Priority.PREFETCH: 1})),
+    ]:
+        random.seed(0)
+        started = time.perf_counter()
+        warmup = asyncio.create_task(prefetch(slots, args.prefetch, args.render_ms))
+        latencies = sorted(
+            await interactive(slots, args.interactive, args.interval_ms, args.render_ms)
+        )
+        await warmup
+        elapsed = time.perf_counter() - started
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{name:10} interactive p50={statistics.median(latencies) * 1000:7.1f}ms "
+            f"p99={p99 * 1000:7.1f}ms warm-up finished in {elapsed:5.1f}s"
+        )
+        if isinstance(slots, RenderScheduler):
+            for priority, stats in slots.stats()["classes"].items():
+                if stats["completed"]:
+                    print(
+                        f"{'':10} {priority:12} queue p50={stats['queue_p50_ms']}ms "
+                        f"p99={stats['queue_p99_ms']}ms"
+                    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=100)
+    parser.add_argument("--interactive", type=int, default=50)
+    parser.add_argument("--interval-ms", type=float, default=40)
+    parser.add_argument("--render-ms", type=float, default=50)
+    asyncio.run(run(parser.parse_args()))
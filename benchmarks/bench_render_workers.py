@@ -0,0 +1,79 @@
+"""
+同じ件数のdocsを同時に描画した時のthroughputを、1つのprocessでの描画とrender workerの数ごとに比較する。
+各workerはそれぞれChromiumを起動し、page poolの大きさ（SOFTREEF_PAGE_POOL_SIZE）まで同時に描画する。
+
+    uv run benchmarks/bench_render_workers.py --workers 1 2 4 --renders 64
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from storybook_fixture import COMPONENTS, StorybookFixture
+from browser_manager import SOFTREEF_PAGE_POOL_SIZE, browser_manager, page_pool
+from render_workers import RenderWorkerPool
+from storybook_async_fetcher import shutdown_converter, stream_docs_markdown
+
+
+async def render_all(fixture: StorybookFixture, stream, renders: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def render(i: int):
+        component = COMPONENTS[i % len(COMPONENTS)]
+        async with semaphore:
+            markdown = "".join(
+                [
+                    chunk
+                    async for chunk in stream(
+                        fixture.iframe_url(component),
+                        "storybook-docs",
+                        "sb-anchor",
+                        True,
+                        "selector",
+                    )
+                ]
+            )
+        assert component in markdown, f"{component} was not rendered"
+
+    started = time.perf_counter()
+    await asyncio.gather(*[render(i) for i in range(renders)])
+    return time.perf_counter() - started
+
+
+async def run(workers: list[int], renders: int):
+    with StorybookFixture() as fixture:
+        try:
+            # Chromiumの起動は計測から除く
+            await render_all(fixture, stream_docs_markdown, 1, 1)
+            elapsed = await render_all(
+                fixture, stream_docs_markdown, renders, SOFTREEF_PAGE_POOL_SIZE
+            )
+            print(f"in-process   {renders / elapsed:7.1f} renders/s ({elapsed:6.2f}s)")
+        finally:
+            await page_pool.close()
+            await browser_manager.close()
+            shutdown_converter()
+
+        for size in workers:
+            pool = RenderWorkerPool(size=size, max_jobs=0)
+            concurrency = SOFTREEF_PAGE_POOL_SIZE * size
+            try:
+                await render_all(fixture, pool.stream, concurrency, concurrency)
+                elapsed = await render_all(fixture, pool.stream, renders, concurrency)
+                print(
+                    f"{size:2} workers   {renders / elapsed:7.1f} renders/s "
+                    f"({elapsed:6.2f}s, restarts={pool.restarts})"
+                )
+            finally:
+                await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--renders", type=int, default=64)
+    args = parser.parse_args()
+    asyncio.run(run(args.workers, args.renders))
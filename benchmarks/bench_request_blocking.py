@@ -0,0 +1,65 @@
+"""
+リソース遮断の有無でstorybookの読み込み時間と転送量を比較する。
+
+    uv run benchmarks/bench_request_blocking.py --iterations 10
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from storybook_fixture import COMPONENTS, StorybookFixture
+from browser_manager import browser_manager, page_pool
+from storybook_async_fetcher import markdown_format_text
+from storybook_request_filter import request_filter
+
+
+async def measure(fixture: StorybookFixture, block: bool, iterations: int) -> dict:
+    latencies = []
+    fixture.reset_counters()
+    for i in range(iterations):
+        component = COMPONENTS[i % len(COMPONENTS)]
+        started = time.perf_counter()
+        markdown = await markdown_format_text(
+            url=fixture.manager_url(component), block_resources=block
+        )
+        latencies.append(time.perf_counter() - started)
+        assert component in markdown, f"{component} was not rendered"
+    return {
+        "block": block,
+        "median_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "kb_per_render": fixture.bytes_sent / iterations / 1024,
+        "requests_per_render": fixture.requests / iterations,
+    }
+
+
+async def run(iterations: int):
+    request_filter.blocked_url_patterns += ("*/analytics/*",)
+    with StorybookFixture() as fixture:
+        try:
+            # 初回のChromium起動は計測から除く
+            await markdown_format_text(url=fixture.manager_url(COMPONENTS[0]))
+            for block in [False, True]:
+                result = await measure(fixture, block, iterations)
+                print(
+                    f"block={result['block']!s:5} "
+                    f"median={result['median_ms']:8.1f}ms "
+                    f"max={result['max_ms']:8.1f}ms "
+                    f"transfer={result['kb_per_render']:8.1f}KB "
+                    f"requests={result['requests_per_render']:5.1f}"
+                )
+        finally:
+            await page_pool.close()
+            await browser_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
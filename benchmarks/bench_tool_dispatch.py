@@ -0,0 +1,103 @@
+"""
+toolの一覧・呼び出しのoverheadを、registryとregistry導入前の方式（呼び出しごとにToolを作り直し、
+一覧のtoolはlist_toolsを線形に探してenumを読み戻す）で比較する。ブラウザやstorybookにはアクセスしない。
+
+    SOFTREEF_DESIGN_SYSTEM_FILE_BASE_PATH=/tmp uv run benchmarks/bench_tool_dispatch.py --calls 20000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "server"))
+
+from mcp import types
+from mcp.types import TextContent, Tool
+
+import storybook_server
+from storybook_server import app, call_tool, list_tools, tool_registry
+
+LIST_TOOL = "get_available_softreef_component_description_list"
+FILE_PATH_TOOL = "get_softreef_component_file_path"
+
+
+async def legacy_list_tools() -> list[Tool]:
+    # 呼び出しごとにenumの連結とToolの構築を行っていた従来のlist_toolsを再現する
+    return [
+        Tool.model_validate(tool.model_dump())
+        for tool in tool_registry.definitions
+    ]
+
+
+async def legacy_call_tool(name: str, arguments: Any):
+    names = [tool.name for tool in tool_registry.definitions]
+    # if/elifの連鎖と同じく、先頭から順に名前を比較する
+    for candidate in names:
+        if candidate == name:
+            break
+    if name == LIST_TOOL:
+        tools = await legacy_list_tools()
+        tool = None
+        for candidate in tools:
+            if candidate.name == "get_softreef_component_description":
+                tool = candidate
+        components = tool.inputSchema.get("properties").get("component").get("enum")
+        return [TextContent(type="text", text=f"{str(components)}")]
+    return await call_tool(name, arguments)
+
+
+async def measure(
+    label: str, calls: int, func: Callable[[], Awaitable[Any]]
+) -> float:
+    await func()
+    started = time.perf_counter()
+    for _ in range(calls):
+        await func()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:62} {calls / elapsed:>10.0f} calls/s "
+        f"{elapsed / calls * 1_000_000:>8.1f}us/call"
+    )
+    return elapsed
+
+
+async def run(calls: int):
+    # 実装ファイルが見つかるコンポーネントが無い環境ではfile pathのtoolは計測しない
+    component = next(
+        (
+            name
+            for name in storybook_server.component_names
+            if f"filepath://softreef/design-system/component/{name}"
+            in storybook_server.ds_uri_2_resources
+        ),
+        None,
+    )
+    handler = app.request_handlers[types.CallToolRequest]
+    list_request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(name=LIST_TOOL, arguments={}),
+    )
+
+    await measure("list_tools (legacy)", calls, legacy_list_tools)
+    await measure("list_tools (registry)", calls, list_tools)
+    await measure(
+        f"{LIST_TOOL} (legacy)", calls, lambda: legacy_call_tool(LIST_TOOL, {})
+    )
+    await measure(f"{LIST_TOOL} (registry)", calls, lambda: call_tool(LIST_TOOL, {}))
+    if component is not None:
+        await measure(
+            f"{FILE_PATH_TOOL} (registry)",
+            calls,
+            lambda: call_tool(FILE_PATH_TOOL, {"component": component}),
+        )
+    # MCPのrequest handlerを経由した場合（resultのvalidationを含む）
+    await measure("tools/call request (registry)", calls, lambda: handler(list_request))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls))
@@ -0,0 +1,290 @@
+"""
+benchmark用のローカルstorybook。
+S3上のstorybookと同様にmanager(index.html)とpreview(iframe.html)を配信し、
+画像・フォント・stylesheet・analytics beaconなどの重いリソースは合成したbytesを返す。
+"""
+import json
+import time
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+COMPONENTS = [
+    "Accordion",
+    "Button",
+    "Chip",
+    "DateTimePicker",
+    "Notification",
+    "Slider",
+    "Stepper",
+    "Table",
+]
+
+
+def story_id(component: str) -> str:
+    return f"softreef-コンポーネント-{component.lower()}--docs"
+
+
+def docs_html(component: str, rows: int = 12, stories: int = 4) -> str:
+    props = "".join(
+        f"<tr><td><span>prop{i}</span><span title='Required'>*</span></td>"
+        f"<td><div><p>{component}のprop{i}の説明です。<code>string</code>を受け取る。</p></div>"
+        f"<div><span><code>'small' | 'medium' | 'large'</code></span></div></td>"
+        f"<td><span><code>medium</code></span></td><td>-</td></tr>"
+        for i in range(rows)
+    )
+    examples = "".join(
+        f"<h3 id='story-{i}' class='sbdocs sbdocs-h3'>"
+        f"<a aria-hidden='true' tabindex='-1' href='#story-{i}' class='sb-anchor' target='_self'>🔗</a>"
+        f"Story {i}</h3>"
+        f"<p>{component}の利用例{i}です。</p>"
+        f"<div class='docblock-source'><pre class='prismjs'><code>"
+        f"&lt;{component} size=&quot;medium&quot; variant=&quot;primary&quot;&gt;\n"
+        f"  Example {i}\n"
+        f"&lt;/{component}&gt;</code></pre></div>"
+        for i in range(stories)
+    )
+    return (
+        "<div class='sbdocs sbdocs-wrapper'><div class='sbdocs sbdocs-content'>"
+        f"<h1 class='sbdocs sbdocs-title'>{component}</h1>"
+        f"<p>{component}は<strong>Softreef</strong>のコンポーネントです。"
+        f"詳しくは<a href='https://example.com/{component}'>ガイドライン</a>を参照してください。</p>"
+        "<ul><li>アクセシビリティに配慮する</li><li>1画面に多用しない</li></ul>"
+        "<h2 id='props' class='sbdocs sbdocs-h2'>"
+        "<a aria-hidden='true' tabindex='-1' href='#props' class='sb-anchor' target='_self'>🔗</a>"
+        "Props</h2>"
+        "<table class='docblock-argstable'><thead><tr><th>Name</th><th>Description</th>"
+        f"<th>Default</th><th>Control</th></tr></thead><tbody>{props}</tbody></table>"
+        f"{examples}</div></div>"
+    )
+
+
+def mdx_source(component: str, doc_blocks: bool = True) -> str:
+    """
+    doc_blocksがFalseの場合は描画が必要なblock（ArgTypes, Canvas）を含まず、静的な取得だけで完結する。
+    """
+    if not doc_blocks:
+        return (
+            "import { Meta } from '@storybook/blocks';\n"
+            f"import * as Stories from './{component}.stories';\n\n"
+            "<Meta of={Stories} />\n\n"
+            f"# {component}\n\n"
+            f"{component}は**Softreef**のコンポーネントです。\n\n"
+            "## Usage\n\n"
+            f"{component}は1画面に多用しないでください。\n"
+        )
+    return (
+        "import { Meta, Canvas, ArgTypes } from '@storybook/blocks';\n"
+        f"import * as Stories from './{component}.stories';\n\n"
+        "<Meta of={Stories} />\n\n"
+        f"# {component}\n\n"
+        f"{component}は**Softreef**のコンポーネントです。\n\n"
+        "## Props\n\n"
+        "<ArgTypes of={Stories} />\n\n"
+        "## Usage\n\n"
+        "<Canvas of={Stories.Primary} />\n\n"
+        f"{component}は1画面に多用しないでください。\n"
+    )
+
+
+def index_json(build: str = "1") -> dict:
+    return {
+        "v": 5,
+        "entries": {
+            story_id(component): {
+                "id": story_id(component),
+                "title": f"Softreef/コンポーネント/{component}",
+                "name": "Docs",
+                "importPath": f"./src/components/{component}/{component}.mdx",
+                "storiesImports": [
+                    f"./src/components/{component}/{component}.stories.tsx"
+                ],
+                "type": "docs",
+                "tags": ["docs", f"build-{build}"],
+            }
+            for component in COMPONENTS
+        },
+    }
+
+
+@dataclass
+class FixtureOptions:
+    asset_delay: float = 0.05
+    image_bytes: int = 200_000
+    font_bytes: int = 120_000
+    stylesheet_bytes: int = 60_000
+    script_bytes: int = 300_000
+    docs_render_delay_ms: int = 150
+    late_mutation_ms: int = 300
+    hmr: bool = False
+    build: str = "1"
+    mdx_doc_blocks: bool = True
+    source_delay: float = 0.0
+
+
+def manager_html(sid: str) -> str:
+    return f"""<!doctype html><html><head>
+<link rel="stylesheet" href="/assets/manager.css">
+<script src="/assets/manager.js"></script>
+</head><body>
+<img src="/assets/logo.png"><img src="/assets/sidebar.png">
+<script src="/analytics/gtag.js" async></script>
+<iframe name="storybook-preview-iframe" src="/iframe.html?id={sid}&viewMode=docs"></iframe>
+</body></html>"""
+
+
+def preview_html(sid: str, options: FixtureOptions) -> str:
+    component = next(c for c in COMPONENTS if story_id(c) == sid)
+    hmr = (
+        "<script>new EventSource('/__webpack_hmr');</script>" if options.hmr else ""
+    )
+    return f"""<!doctype html><html><head>
+<link rel="stylesheet" href="/assets/preview.css">
+<style>@font-face {{ font-family: Nunito; src: url(/assets/nunito.woff2); }}</style>
+<script src="/assets/preview.js"></script>
+</head><body>
+<div id="storybook-docs"></div>
+{hmr}
+<script>
+setTimeout(() => {{
+  const docs = document.getElementById("storybook-docs");
+  docs.innerHTML = {json.dumps(docs_html(component))};
+  for (let i = 0; i < 4; i++) {{
+    const img = document.createElement("img");
+    img.src = "/assets/example-" + i + ".png";
+    docs.querySelector(".sbdocs-content").appendChild(img);
+  }}
+  setTimeout(() => {{
+    const p = document.createElement("p");
+    p.textContent = "最終更新: fixture";
+    docs.querySelector(".sbdocs-content").appendChild(p);
+  }}, {options.late_mutation_ms});
+}}, {options.docs_render_delay_ms});
+navigator.sendBeacon && navigator.sendBeacon("/analytics/collect", "x");
+</script>
+</body></html>"""
+
+
+class StorybookFixture:
+    def __init__(self, options: FixtureOptions | None = None, port: int = 0):
+        self.options = options or FixtureOptions()
+        self.bytes_sent = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def manager_url(self, component: str) -> str:
+        return f"{self.base_url}/?path=/docs/{story_id(component)}"
+
+    def iframe_url(self, component: str) -> str:
+        return f"{self.base_url}/iframe.html?id={story_id(component)}&viewMode=docs"
+
+    def reset_counters(self):
+        with self._lock:
+            self.bytes_sent = 0
+            self.requests = 0
+
+    def _record(self, size: int):
+        with self._lock:
+            self.bytes_sent += size
+            self.requests += 1
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, body: bytes, content_type: str, status: int = 200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+                self.send_header("ETag", f'"build-{fixture.options.build}"')
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+                fixture._record(len(body))
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                options = fixture.options
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                path = parts.path
+
+                if path in ["/", "/index.html"]:
+                    sid = query.get("path", ["/docs/"])[0].removeprefix("/docs/")
+                    return self._send(manager_html(sid).encode(), "text/html")
+                if path == "/iframe.html":
+                    sid = query.get("id", [story_id(COMPONENTS[0])])[0]
+                    return self._send(
+                        preview_html(sid, options).encode(), "text/html"
+                    )
+                if path == "/index.json":
+                    if self.headers.get("If-None-Match") == f'"build-{options.build}"':
+                        self.send_response(304)
+                        self.end_headers()
+                        return fixture._record(0)
+                    return self._send(
+                        json.dumps(index_json(options.build)).encode(),
+                        "application/json",
+                    )
+                if path.startswith("/src/") and path.endswith(".mdx"):
+                    component = path.rsplit("/", 1)[-1].removesuffix(".mdx")
+                    time.sleep(options.source_delay)
+                    body = mdx_source(component, options.mdx_doc_blocks)
+                    return self._send(body.encode(), "text/plain")
+                if path == "/__webpack_hmr":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    try:
+                        for _ in range(600):
+                            self.wfile.write(b": heartbeat\n\n")
+                            self.wfile.flush()
+                            time.sleep(0.1)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    return
+                if path.startswith("/analytics/"):
+                    time.sleep(options.asset_delay)
+                    return self._send(b"", "text/plain")
+                if path.startswith("/assets/"):
+                    time.sleep(options.asset_delay)
+                    if path.endswith(".png"):
+                        return self._send(b"\0" * options.image_bytes, "image/png")
+                    if path.endswith(".woff2"):
+                        return self._send(b"\0" * options.font_bytes, "font/woff2")
+                    if path.endswith(".css"):
+                        body = b"/*" + b" " * options.stylesheet_bytes + b"*/"
+                        return self._send(body, "text/css")
+                    if path.endswith(".js"):
+                        body = b"//" + b" " * options.script_bytes
+                        return self._send(body, "application/javascript")
+                self._send(b"not found", "text/plain", status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                self.rfile.read(length)
+                self._send(b"", "text/plain")
+
+        return Handler
+
+    def __enter__(self) -> "StorybookFixture":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
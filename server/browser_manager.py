@@ -0,0 +1,263 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, BrowserContext, Page, Playwright
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("browser_manager")
+
+SOFTREEF_CHROME_EXECUTABLE_PATH = os.getenv(
+    "SOFTREEF_CHROME_EXECUTABLE_PATH",
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+)
+SOFTREEF_PAGE_POOL_SIZE = int(os.getenv("SOFTREEF_PAGE_POOL_SIZE", "4"))
+SOFTREEF_PAGE_POOL_ACQUIRE_TIMEOUT = float(
+    os.getenv("SOFTREEF_PAGE_POOL_ACQUIRE_TIMEOUT", "30")
+)
+SOFTREEF_PAGE_MAX_USES = int(os.getenv("SOFTREEF_PAGE_MAX_USES", "50"))
+
+
+class BrowserManager:
+    """
+    プロセス内で共有するChromiumを管理する。
+    初回利用時に起動し、クラッシュ等で切断されていた場合は再起動する。
+    """
+
+    def __init__(
+        self,
+        executable_path: str | None = SOFTREEF_CHROME_EXECUTABLE_PATH or None,
+        headless: bool = True,
+    ):
+        self.executable_path = executable_path
+        self.headless = headless
+        self._playwright: "Playwright | None" = None
+        self._browser: "Browser | None" = None
+        self._lock = asyncio.Lock()
+        self.launch_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def get_browser(self) -> "Browser":
+        if self.is_running:
+            return self._browser
+
+        async with self._lock:
+            if not self.is_running:
+                await self._launch()
+            return self._browser
+
+    async def _launch(self):
+        if self._browser is not None:
+            logger.warning("Chromium was disconnected. Restarting the browser.")
+            await self._close_browser()
+
+        if self._playwright is None:
+            from playwright.async_api import async_playwright
+
+            self._playwright = await async_playwright().start()
+
+        self._browser = await self._playwright.chromium.launch(
+            headless=self.headless,
+            executable_path=self.executable_path,
+        )
+        self.launch_count += 1
+        logger.info(f"Chromium was launched (launch count: {self.launch_count})")
+
+    async def new_context(self) -> "BrowserContext":
+        browser = await self.get_browser()
+        try:
+            return await browser.new_context()
+        except Exception:
+            if browser.is_connected():
+                raise
+            # 同じChromiumで失敗した他の描画が先に起動し直していれば、そのChromiumを使う
+            return await (await self.get_browser()).new_context()
+
+    async def _close_browser(self):
+        browser, self._browser = self._browser, None
+        if browser is None:
+            return
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.warning(f'Error "{str(e)}" was occurred during closing browser')
+
+    async def close(self):
+        async with self._lock:
+            await self._close_browser()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+
+class PagePoolTimeoutError(RuntimeError):
+    pass
+
+
+@dataclass
+class PooledPage:
+    context: "BrowserContext"
+    page: "Page"
+    launch_count: int
+    uses: int = 0
+
+
+class PagePool:
+    """
+    同時に開くpageの数を制限するpool。
+    空きが無い場合は到着順に待たせ、acquire_timeoutを超えたリクエストはエラーにする。
+    pageはmax_uses回利用されたら破棄して作り直す。
+    """
+
+    def __init__(
+        self,
+        manager: BrowserManager,
+        size: int = SOFTREEF_PAGE_POOL_SIZE,
+        acquire_timeout: float = SOFTREEF_PAGE_POOL_ACQUIRE_TIMEOUT,
+        max_uses: int = SOFTREEF_PAGE_MAX_USES,
+    ):
+        self.manager = manager
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.max_uses = max_uses
+        self._idle: deque[PooledPage] = deque()
+        self._waiters: deque[asyncio.Future] = deque()
+        self._in_use = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def _acquire_slot(self):
+        if self._in_use < self.size and not self._waiters:
+            self._in_use += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            # 時間切れと同じ周回で枠が渡されていた場合は、取得できたものとして扱う
+            if waiter.done() and not waiter.cancelled():
+                return
+            self.timeouts += 1
+            raise PagePoolTimeoutError(
+                f"No page became available within {self.acquire_timeout} seconds "
+                f"(queue depth: {self.queue_depth})"
+            )
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release_slot(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._in_use -= 1
+
+    async def _checkout(self) -> PooledPage:
+        while self._idle:
+            pooled = self._idle.popleft()
+            if (
+                pooled.launch_count == self.manager.launch_count
+                and self.manager.is_running
+                and not pooled.page.is_closed()
+            ):
+                return pooled
+            await self._discard(pooled)
+
+        context = await self.manager.new_context()
+        page = await context.new_page()
+        return PooledPage(
+            context=context, page=page, launch_count=self.manager.launch_count
+        )
+
+    async def _checkin(self, pooled: PooledPage, reusable: bool):
+        pooled.uses += 1
+        if not reusable or pooled.uses >= self.max_uses:
+            self.recycled += 1
+            await self._discard(pooled)
+            return
+
+        try:
+            await pooled.context.clear_cookies()
+            self._idle.append(pooled)
+        except Exception:
+            await self._discard(pooled)
+
+    async def _discard(self, pooled: PooledPage):
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            logger.warning(f'Error "{str(e)}" was occurred during closing context')
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator["Page"]:
+        started = time.perf_counter()
+        await self._acquire_slot()
+        wait = time.perf_counter() - started
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > 1.0:
+            logger.info(
+                f"Waited {wait:.2f}s for a page (queue depth: {self.queue_depth})"
+            )
+
+        try:
+            pooled = await self._checkout()
+            reusable = False
+            try:
+                yield pooled.page
+                reusable = True
+            finally:
+                await self._checkin(pooled, reusable=reusable)
+        finally:
+            self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "queue_depth": self.queue_depth,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+            "avg_wait_ms": (
+                self.total_wait / self.acquired * 1000 if self.acquired else 0.0
+            ),
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    async def close(self):
+        while self._idle:
+            await self._discard(self._idle.popleft())
+
+
+browser_manager = BrowserManager()
+page_pool = PagePool(browser_manager)
@@ -0,0 +1,126 @@
+import os
+import json
+import base64
+import binascii
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+from markdown_cache import SOFTREEF_CACHE_MAX_ENTRIES
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("chunked_documents")
+
+SOFTREEF_CHUNK_BYTES = int(os.getenv("SOFTREEF_CHUNK_BYTES", "40000"))
+MIN_CHUNK_BYTES = 1000
+# chunkの末尾をこの範囲で改行の位置まで戻し、行の途中で切らないようにする
+LINE_BREAK_WINDOW = 512
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    start: int
+    end: int
+    total: int
+    next_cursor: str | None
+
+
+def version_of(text: str) -> str:
+    # 同じ文字列のhashは文字列自体に保持されるため、キャッシュ済みのmarkdownでは全体を走査しない
+    return f"{hash(text) & 0xFFFFFFFFFFFF:x}-{len(text)}"
+
+
+class ChunkedDocuments:
+    """
+    docsをUTF-8のbytesとしてversionごとに保持し、cursorの位置からsize bytes以内のchunkを切り出す。
+    切り出しはmemoryviewのsliceで行い、文字の境界や改行に合わせる調整も定数の範囲に留める。
+    """
+
+    def __init__(self, max_entries: int = SOFTREEF_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._buffers: OrderedDict[str, tuple[str, memoryview]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def buffer(self, key: str, text: str) -> tuple[str, memoryview]:
+        version = version_of(text)
+        entry = self._buffers.get(key)
+        if entry is not None and entry[0] == version:
+            self._buffers.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = (version, memoryview(text.encode("utf-8")))
+        self._buffers[key] = entry
+        self._buffers.move_to_end(key)
+        while len(self._buffers) > self.max_entries:
+            self._buffers.popitem(last=False)
+        return entry
+
+    def encode_cursor(self, key: str, version: str, offset: int) -> str:
+        payload = json.dumps({"key": key, "version": version, "offset": offset})
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, key: str, version: str, cursor: str) -> int:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            cursor_key, cursor_version = payload["key"], payload["version"]
+            offset = payload["offset"]
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if cursor_key != key:
+            raise ValueError("The cursor was issued for another document or sections")
+        if cursor_version != version:
+            raise ValueError(
+                "The document was updated after the cursor was issued. "
+                "Please fetch it again without cursor."
+            )
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        return offset
+
+    def chunk(
+        self, key: str, text: str, size: int, cursor: str | None = None
+    ) -> Chunk:
+        size = max(size, MIN_CHUNK_BYTES)
+        version, buffer = self.buffer(key, text)
+        total = len(buffer)
+        start = self.decode_cursor(key, version, cursor) if cursor else 0
+        if start > total:
+            raise ValueError(f"The cursor is out of range: {cursor}")
+
+        end = min(start + size, total)
+        if end < total:
+            window_start = max(end - LINE_BREAK_WINDOW, start)
+            line_break = bytes(buffer[window_start:end]).rfind(b"\n")
+            if line_break >= 0:
+                end = window_start + line_break + 1
+            # UTF-8の継続byte（0b10xxxxxx）の途中で切らない
+            while end > start and buffer[end] & 0xC0 == 0x80:
+                end -= 1
+
+        return Chunk(
+            text=bytes(buffer[start:end]).decode("utf-8"),
+            start=start,
+            end=end,
+            total=total,
+            next_cursor=(
+                self.encode_cursor(key, version, end) if end < total else None
+            ),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._buffers),
+            "bytes": sum(len(buffer) for _, buffer in self._buffers.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+chunked_documents = ChunkedDocuments()
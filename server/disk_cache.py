@@ -0,0 +1,123 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("disk_cache")
+
+SOFTREEF_CACHE_DIR = os.getenv(
+    "SOFTREEF_CACHE_DIR", str(Path.home() / ".cache" / "softreef-mcp")
+)
+SOFTREEF_DISK_CACHE = os.getenv("SOFTREEF_DISK_CACHE", "1") == "1"
+SOFTREEF_DISK_CACHE_MAX_AGE = float(os.getenv("SOFTREEF_DISK_CACHE_MAX_AGE", "3600"))
+
+
+@dataclass(frozen=True)
+class DiskCacheEntry:
+    uri: str
+    markdown: str
+    validator: str | None
+    validated_at: float
+
+    def is_fresh(self, max_age: float = SOFTREEF_DISK_CACHE_MAX_AGE) -> bool:
+        return time.time() - self.validated_at < max_age
+
+
+class DiskCache:
+    """
+    描画済みのmarkdownをdocsごとのvalidator（ソースのhash）と共にSQLiteへ保存し、サーバーの再起動後も利用する。
+    WALモードで開くため、同じディレクトリを複数のサーバープロセスで共有できる。
+    """
+
+    def __init__(self, directory: str = SOFTREEF_CACHE_DIR):
+        self.path = Path(directory) / "markdown.sqlite3"
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            columns = {
+                row[1] for row in connection.execute("PRAGMA table_info(markdown)")
+            }
+            if columns and "validator" not in columns:
+                # index.jsonのETagで確認していた頃のentryはdocsの変更を検知できないため捨てる
+                logger.info(f"Discarding disk cache entries of the old format in {self.path}")
+                connection.execute("DROP TABLE markdown")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS markdown (
+                    uri TEXT PRIMARY KEY,
+                    markdown TEXT NOT NULL,
+                    validator TEXT,
+                    validated_at REAL NOT NULL
+                )
+                """
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, uri: str) -> DiskCacheEntry | None:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT uri, markdown, validator, validated_at "
+                "FROM markdown WHERE uri = ?",
+                (uri,),
+            )
+            .fetchone()
+        )
+        return DiskCacheEntry(*row) if row is not None else None
+
+    def set(self, uri: str, markdown: str, validator: str | None = None):
+        self._connection().execute(
+            """
+            INSERT INTO markdown (uri, markdown, validator, validated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(uri) DO UPDATE SET
+                markdown = excluded.markdown,
+                validator = excluded.validator,
+                validated_at = excluded.validated_at
+            """,
+            (uri, markdown, validator, time.time()),
+        )
+
+    def documents(self) -> dict[str, str]:
+        return dict(
+            self._connection().execute("SELECT uri, markdown FROM markdown").fetchall()
+        )
+
+    def touch(self, uri: str):
+        self._connection().execute(
+            "UPDATE markdown SET validated_at = ? WHERE uri = ?", (time.time(), uri)
+        )
+
+    def invalidate(self, uri: str) -> bool:
+        cursor = self._connection().execute(
+            "DELETE FROM markdown WHERE uri = ?", (uri,)
+        )
+        return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        return self._connection().execute("DELETE FROM markdown").rowcount
+
+    def stats(self) -> dict:
+        count, size = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(markdown)), 0) FROM markdown")
+            .fetchone()
+        )
+        return {"path": str(self.path), "entries": count, "characters": size}
+
+
+disk_cache = DiskCache()
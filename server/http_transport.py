@@ -0,0 +1,197 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+import anyio
+from dotenv import load_dotenv
+from mcp.server import Server
+from mcp.server.sse import SseServerTransport
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from starlette.types import Message, Receive, Scope, Send
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("http_transport")
+
+SOFTREEF_TRANSPORT = os.getenv("SOFTREEF_TRANSPORT", "stdio")
+SOFTREEF_HTTP_HOST = os.getenv("SOFTREEF_HTTP_HOST", "127.0.0.1")
+SOFTREEF_HTTP_PORT = int(os.getenv("SOFTREEF_HTTP_PORT", "8000"))
+SOFTREEF_HTTP_MAX_CONNECTIONS = int(os.getenv("SOFTREEF_HTTP_MAX_CONNECTIONS", "64"))
+SOFTREEF_HTTP_CONNECTION_CONCURRENCY = int(
+    os.getenv("SOFTREEF_HTTP_CONNECTION_CONCURRENCY", "4")
+)
+
+SSE_PATH = "/sse"
+MESSAGE_PATH = "/messages/"
+
+# 接続ごとの同時実行数を制限するsemaphore。stdioで動いている場合はNone
+connection_limit: ContextVar[asyncio.Semaphore | None] = ContextVar(
+    "connection_limit", default=None
+)
+
+
+class ConnectionLimiter:
+    """
+    HTTPで受け付ける接続数と、1つの接続が同時に実行できるrequestの数を制限する。
+    1つのclientがrequestを大量に送っても、他のclientの分の描画やキャッシュの参照が詰まらないようにする。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = SOFTREEF_HTTP_MAX_CONNECTIONS,
+        concurrency: int = SOFTREEF_HTTP_CONNECTION_CONCURRENCY,
+    ):
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        self.active = 0
+        self.peak = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.requests = 0
+        self.queued = 0
+
+    @property
+    def full(self) -> bool:
+        return self.max_connections > 0 and self.active >= self.max_connections
+
+    @contextmanager
+    def connection(self):
+        """
+        接続の間、その接続で実行されるrequestがsemaphoreを参照できるようにする。
+        mcpのServerはrequestごとのtaskを接続のtask groupから作るため、ContextVarが引き継がれる。
+        """
+        self.active += 1
+        self.accepted += 1
+        self.peak = max(self.peak, self.active)
+        token = connection_limit.set(
+            asyncio.Semaphore(self.concurrency) if self.concurrency > 0 else None
+        )
+        try:
+            yield
+        finally:
+            connection_limit.reset(token)
+            self.active -= 1
+
+    @asynccontextmanager
+    async def request(self):
+        semaphore = connection_limit.get()
+        if semaphore is None:
+            yield
+            return
+        self.requests += 1
+        if semaphore.locked():
+            self.queued += 1
+        async with semaphore:
+            yield
+
+    def stats(self) -> dict:
+        return {
+            "transport": SOFTREEF_TRANSPORT,
+            "max_connections": self.max_connections,
+            "concurrency_per_connection": self.concurrency,
+            "active": self.active,
+            "peak": self.peak,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "requests": self.requests,
+            "queued": self.queued,
+        }
+
+
+connection_limiter = ConnectionLimiter()
+
+
+class SseEndpoint:
+    """
+    SSEの接続を受け付けるASGI app。
+    応答はSseServerTransportが送るため、Starletteのendpoint関数ではなくASGI appとして登録する。
+    """
+
+    def __init__(
+        self, server: Server, transport: SseServerTransport, limiter: ConnectionLimiter
+    ):
+        self.server = server
+        self.transport = transport
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self.limiter.full:
+            self.limiter.rejected += 1
+            logger.warning(
+                f"Rejected a connection: {self.limiter.active} connections are active"
+            )
+            response = Response(
+                "Too many connections", status_code=503, headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        # mcpのSseServerTransportはclientが切断してもread streamを閉じないため、server.runが終わらない。
+        # http.disconnectを受け取った時点でserver.runを止め、接続の枠を空ける
+        disconnected = anyio.Event()
+
+        async def receive_until_disconnect() -> Message:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            return message
+
+        with self.limiter.connection():
+            async with self.transport.connect_sse(
+                scope, receive_until_disconnect, send
+            ) as streams:
+                async with anyio.create_task_group() as tg:
+
+                    async def run():
+                        await self.server.run(
+                            streams[0],
+                            streams[1],
+                            self.server.create_initialization_options(),
+                        )
+                        tg.cancel_scope.cancel()
+
+                    tg.start_soon(run)
+                    await disconnected.wait()
+                    tg.cancel_scope.cancel()
+
+
+def create_app(server: Server, limiter: ConnectionLimiter = connection_limiter) -> Starlette:
+    transport = SseServerTransport(MESSAGE_PATH)
+
+    async def health(request) -> JSONResponse:
+        return JSONResponse(limiter.stats())
+
+    return Starlette(
+        routes=[
+            Route(SSE_PATH, endpoint=SseEndpoint(server, transport, limiter)),
+            Mount(MESSAGE_PATH, app=transport.handle_post_message),
+            Route("/health", endpoint=health),
+        ],
+    )
+
+
+async def serve_sse(
+    server: Server,
+    host: str = SOFTREEF_HTTP_HOST,
+    port: int = SOFTREEF_HTTP_PORT,
+    limiter: ConnectionLimiter = connection_limiter,
+):
+    """
+    1つのprocessで複数のclientを受け付ける。ブラウザやキャッシュは全ての接続で共有される。
+    """
+    import uvicorn
+
+    config = uvicorn.Config(
+        create_app(server, limiter),
+        host=host,
+        port=port,
+        log_level="warning",
+        # SSEの接続は閉じられるまで続くため、終了時は待ち続けずに切断する
+        timeout_graceful_shutdown=5,
+    )
+    logger.info(f"Serving MCP over SSE at http://{host}:{port}{SSE_PATH}")
+    await uvicorn.Server(config).serve()
@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("markdown_cache")
+
+SOFTREEF_CACHE_MAX_ENTRIES = int(os.getenv("SOFTREEF_CACHE_MAX_ENTRIES", "256"))
+SOFTREEF_CACHE_MAX_BYTES = int(
+    os.getenv("SOFTREEF_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+SOFTREEF_CACHE_TTL = float(os.getenv("SOFTREEF_CACHE_TTL", "3600"))
+
+
+@dataclass
+class CacheEntry:
+    markdown: str
+    size: int
+    stored_at: float
+    expires_at: float
+    hits: int = 0
+
+
+class MarkdownCache:
+    """
+    resourceのURIをkeyに描画済みのmarkdownを保持するLRUキャッシュ。
+    件数・bytes数の上限を超えた場合は最も古く参照されたものから破棄し、TTLを過ぎたものは返さない。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = SOFTREEF_CACHE_MAX_ENTRIES,
+        max_bytes: int = SOFTREEF_CACHE_MAX_BYTES,
+        ttl: float = SOFTREEF_CACHE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __contains__(self, uri: str) -> bool:
+        entry = self._entries.get(uri)
+        return entry is not None and entry.expires_at > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, uri: str) -> str | None:
+        entry = self._entries.get(uri)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self.expirations += 1
+            self.misses += 1
+            self._remove(uri)
+            return None
+
+        self._entries.move_to_end(uri)
+        entry.hits += 1
+        self.hits += 1
+        return entry.markdown
+
+    def set(self, uri: str, markdown: str):
+        size = len(markdown.encode("utf-8"))
+        if size > self.max_bytes:
+            logger.warning(f"{uri} ({size} bytes) is too large to be cached")
+            return
+
+        if uri in self._entries:
+            self._remove(uri)
+        now = time.monotonic()
+        self._entries[uri] = CacheEntry(
+            markdown=markdown, size=size, stored_at=now, expires_at=now + self.ttl
+        )
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self.evictions += 1
+
+    def _remove(self, uri: str):
+        entry = self._entries.pop(uri)
+        self._bytes -= entry.size
+
+    def invalidate(self, uri: str) -> bool:
+        if uri not in self._entries:
+            return False
+        self._remove(uri)
+        return True
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+        return count
+
+    def entries(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "uri": uri,
+                "bytes": entry.size,
+                "hits": entry.hits,
+                "age_seconds": round(now - entry.stored_at, 1),
+                "expires_in_seconds": round(entry.expires_at - now, 1),
+            }
+            for uri, entry in reversed(self._entries.items())
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+markdown_cache = MarkdownCache()
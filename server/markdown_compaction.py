@@ -0,0 +1,323 @@
+import os
+import re
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable
+from dotenv import load_dotenv
+
+from markdown_cache import SOFTREEF_CACHE_MAX_ENTRIES
+from markdown_sections import parse_sections
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("markdown_compaction")
+
+SOFTREEF_TOKENIZER = os.getenv("SOFTREEF_TOKENIZER", "tiktoken")
+SOFTREEF_TIKTOKEN_ENCODING = os.getenv("SOFTREEF_TIKTOKEN_ENCODING", "cl100k_base")
+
+FENCE_PATTERN = re.compile(r"^(```|~~~)")
+TABLE_SEPARATOR_PATTERN = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+EXAMPLE_HEADING_PATTERN = re.compile(
+    r"^(stories|story\b|examples?\b|demo|使用例|利用例|実装例|サンプル)", re.IGNORECASE
+)
+CELL_MARKUP_PATTERN = re.compile(r"[*_`]")
+
+
+class TokenCounter:
+    """
+    tiktokenがinstallされていればそのencodingで、無ければ文字種から近似してtokenを数える。
+    近似では英数字・記号は4文字で1token、それ以外（日本語など）は1文字で1tokenとする。
+    """
+
+    def __init__(
+        self,
+        tokenizer: str = SOFTREEF_TOKENIZER,
+        encoding_name: str = SOFTREEF_TIKTOKEN_ENCODING,
+    ):
+        self.encoding = None
+        if tokenizer == "tiktoken":
+            try:
+                import tiktoken
+
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except ImportError:
+                logger.info("tiktoken is not installed. Token counts are approximated.")
+            except Exception as e:
+                logger.warning(
+                    f'Error "{str(e)}" was occurred during loading {encoding_name}. '
+                    "Token counts are approximated."
+                )
+
+    @property
+    def name(self) -> str:
+        return self.encoding.name if self.encoding is not None else "heuristic"
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        ascii_characters = sum(1 for character in text if character.isascii())
+        return (ascii_characters + 3) // 4 + len(text) - ascii_characters
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return self.encoding.decode(tokens[:max_tokens])
+
+        cost = 0.0
+        for index, character in enumerate(text):
+            cost += 0.25 if character.isascii() else 1
+            if cost > max_tokens:
+                return text[:index]
+        return text
+
+
+@dataclass
+class Compaction:
+    text: str
+    tokens: int
+    original_tokens: int
+    removed: list[str] = field(default_factory=list)
+    # 省略した内容の説明。textの末尾に付けてもmax_tokensに収まる場合だけ持つ
+    note: str = ""
+
+    @property
+    def annotated(self) -> str:
+        if not self.note:
+            return self.text
+        return f"{self.text.rstrip()}\n\n{self.note}"
+
+
+def omission_note(compaction: Compaction, max_tokens: int) -> str:
+    return (
+        f"> max_tokens({max_tokens})に収めるため省略しました"
+        f"（{compaction.original_tokens} → {compaction.tokens} tokens）: "
+        f"{', '.join(compaction.removed)}"
+    )
+
+
+def drop_code_blocks(markdown: str) -> tuple[str, int]:
+    """
+    storyのsourceなどのcode block（4文字のindentかfenceで囲まれた部分）を取り除く。
+    """
+    lines = markdown.split("\n")
+    kept: list[str] = []
+    removed = 0
+    fenced = False
+    in_block = False
+    for index, line in enumerate(lines):
+        if FENCE_PATTERN.match(line):
+            if not fenced:
+                removed += 1
+            fenced = not fenced
+            continue
+        if fenced:
+            continue
+
+        previous_blank = not kept or not kept[-1].strip()
+        indented = line.startswith(("    ", "\t")) and line.strip()
+        if indented and (in_block or previous_blank):
+            if not in_block:
+                removed += 1
+            in_block = True
+            continue
+        if in_block and not line.strip():
+            # code block内の空行は次の行もcodeであれば取り除く
+            following = next(
+                (next_line for next_line in lines[index + 1 :] if next_line.strip()), ""
+            )
+            if following.startswith(("    ", "\t")):
+                continue
+        in_block = False
+        kept.append(line)
+    return collapse_blank_lines("\n".join(kept)), removed
+
+
+def collapse_tables(markdown: str) -> tuple[str, int]:
+    """
+    propsなどの表を、1列目（名前）だけを並べた1行にまとめる。
+    """
+    lines = markdown.split("\n")
+    result: list[str] = []
+    collapsed = 0
+    index = 0
+    while index < len(lines):
+        if (
+            index + 1 < len(lines)
+            and "|" in lines[index]
+            and TABLE_SEPARATOR_PATTERN.match(lines[index + 1])
+        ):
+            header = split_row(lines[index])
+            end = index + 2
+            names = []
+            while end < len(lines) and "|" in lines[end] and lines[end].strip():
+                cells = split_row(lines[end])
+                if cells and cells[0]:
+                    names.append(cells[0])
+                end += 1
+            label = header[0] if header and header[0] else "Items"
+            result.append(f"{label}: {', '.join(names)}")
+            collapsed += 1
+            index = end
+            continue
+        result.append(lines[index])
+        index += 1
+    return "\n".join(result), collapsed
+
+
+def split_row(line: str) -> list[str]:
+    cells = line.strip().strip("|").split("|")
+    return [" ".join(CELL_MARKUP_PATTERN.sub("", cell).split()) for cell in cells]
+
+
+def example_ranges(markdown: str) -> list[tuple[int, int]]:
+    return [
+        (section.start, section.end)
+        for section in parse_sections(markdown).walk()
+        if section.level > 0 and EXAMPLE_HEADING_PATTERN.match(section.title.strip())
+    ]
+
+
+def collapse_blank_lines(markdown: str) -> str:
+    return re.sub(r"\n{3,}", "\n\n", markdown)
+
+
+def compact(
+    markdown: str,
+    max_tokens: int,
+    counter: TokenCounter,
+    original_tokens: int | None = None,
+) -> Compaction:
+    """
+    max_tokensに収まるまで、story sourceのcode block、propsの表、例の見出しの順に省略する。
+    それでも収まらない場合は末尾を切り詰める。
+    """
+    original_tokens = (
+        counter.count(markdown) if original_tokens is None else original_tokens
+    )
+    if original_tokens <= max_tokens:
+        return Compaction(markdown, original_tokens, original_tokens)
+
+    removed = []
+    text = markdown
+    steps: list[tuple[Callable[[str], tuple[str, int]], str]] = [
+        (drop_code_blocks, "story source blocks"),
+        (collapse_tables, "props tables (collapsed to names)"),
+    ]
+    tokens = original_tokens
+    for step, label in steps:
+        text, count = step(text)
+        if count:
+            removed.append(f"{count} {label}")
+            tokens = counter.count(text)
+        if tokens <= max_tokens:
+            return Compaction(text, tokens, original_tokens, removed)
+
+    # 例の見出しは後ろから順に取り除く
+    trimmed = 0
+    for start, end in sorted(example_ranges(text), reverse=True):
+        text = collapse_blank_lines(text[:start] + text[end:])
+        trimmed += 1
+        tokens = counter.count(text)
+        if tokens <= max_tokens:
+            break
+    if trimmed:
+        removed.append(f"{trimmed} examples")
+
+    if tokens > max_tokens:
+        truncated = counter.truncate(text, max_tokens)
+        line_end = truncated.rfind("\n")
+        if line_end > 0:
+            truncated = truncated[:line_end]
+        removed.append(f"the rest after {len(truncated)} characters (truncated)")
+        text = truncated
+        tokens = counter.count(text)
+    return Compaction(text, tokens, original_tokens, removed)
+
+
+class CompactionCache:
+    """
+    docsのversionごとにtoken数と、max_tokensごとの省略結果を保持する。
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter | None = None,
+        max_entries: int = SOFTREEF_CACHE_MAX_ENTRIES,
+    ):
+        self._counter = counter
+        self.max_entries = max_entries
+        self._counts: OrderedDict[tuple, int] = OrderedDict()
+        self._compactions: OrderedDict[tuple, Compaction] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def counter(self) -> TokenCounter:
+        # tiktokenのencodingの読み込みは重いため、初めて数える時まで遅らせる
+        if self._counter is None:
+            self._counter = TokenCounter()
+        return self._counter
+
+    def _remember(self, entries: OrderedDict, key: tuple, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def count(self, key: str, text: str) -> int:
+        version = (key, hash(text), len(text))
+        if version in self._counts:
+            self._counts.move_to_end(version)
+            self.hits += 1
+            return self._counts[version]
+        self.misses += 1
+        tokens = self.counter.count(text)
+        self._remember(self._counts, version, tokens)
+        return tokens
+
+    def compact(self, key: str, text: str, max_tokens: int) -> Compaction:
+        version = (key, hash(text), len(text), max_tokens)
+        compaction = self._compactions.get(version)
+        if compaction is not None:
+            self._compactions.move_to_end(version)
+            self.hits += 1
+            return compaction
+        compaction = self._compact_with_note(text, max_tokens, self.count(key, text))
+        self._remember(self._compactions, version, compaction)
+        return compaction
+
+    def _compact_with_note(
+        self, text: str, max_tokens: int, original_tokens: int
+    ) -> Compaction:
+        """
+        省略した場合は末尾に説明を付ける。説明の分のtokenを差し引いた予算で省略し直し、
+        説明を含めてmax_tokensに収める。説明だけで収まらない場合は説明を付けない。
+        """
+        budget = max_tokens
+        compaction = compact(text, budget, self.counter, original_tokens)
+        while compaction.removed:
+            note = omission_note(compaction, max_tokens)
+            compaction.note = note
+            overflow = self.counter.count(compaction.annotated) - max_tokens
+            if overflow <= 0:
+                return compaction
+            if budget <= 0:
+                compaction.note = ""
+                return compact(text, max_tokens, self.counter, original_tokens)
+            budget = max(budget - overflow, 0)
+            compaction = compact(text, budget, self.counter, original_tokens)
+        return compaction
+
+    def stats(self) -> dict:
+        return {
+            "tokenizer": self.counter.name if self._counter is not None else None,
+            "counts": len(self._counts),
+            "compactions": len(self._compactions),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+compaction_cache = CompactionCache()
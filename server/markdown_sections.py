@@ -0,0 +1,163 @@
+import re
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from markdown_cache import SOFTREEF_CACHE_MAX_ENTRIES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("markdown_sections")
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^(```|~~~)")
+PATH_SEPARATOR = "/"
+
+
+@dataclass
+class Section:
+    title: str
+    level: int
+    start: int
+    end: int
+    parent: "Section | None" = field(default=None, repr=False)
+    children: list["Section"] = field(default_factory=list)
+
+    @property
+    def path(self) -> list[str]:
+        titles = []
+        section = self
+        while section is not None and section.level > 0:
+            titles.append(section.title)
+            section = section.parent
+        return titles[::-1]
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def normalize(title: str) -> str:
+    return " ".join(title.replace("*", "").replace("`", "").split()).lower()
+
+
+def parse_sections(markdown: str) -> Section:
+    """
+    markdownの見出しから、各見出しの範囲（見出しの行から次の同じ以上のlevelの見出しの手前まで）の木を作る。
+    4文字のindentやfenceで囲まれたcode block内の`#`は見出しとして扱わない。
+    """
+    root = Section(title="", level=0, start=0, end=len(markdown))
+    stack = [root]
+    fenced = False
+    offset = 0
+    for line in markdown.splitlines(keepends=True):
+        start = offset
+        offset += len(line)
+        if FENCE_PATTERN.match(line):
+            fenced = not fenced
+            continue
+        if fenced or line.startswith(("    ", "\t")):
+            continue
+        match = HEADING_PATTERN.match(line.rstrip("\n"))
+        if match is None:
+            continue
+
+        level = len(match.group(1))
+        while stack[-1].level >= level:
+            stack.pop().end = start
+        section = Section(
+            title=match.group(2), level=level, start=start, end=len(markdown)
+        )
+        section.parent = stack[-1]
+        stack[-1].children.append(section)
+        stack.append(section)
+    return root
+
+
+def outline(root: Section) -> list[str]:
+    return [
+        PATH_SEPARATOR.join(section.path)
+        for section in root.walk()
+        if section is not root
+    ]
+
+
+def find_sections(root: Section, selector: str) -> list[Section]:
+    """
+    selectorは見出しの名前（例: `Props`）か、`/`で区切った見出しのpath（例: `Button/Props`）。
+    pathは末尾が一致すれば良く、大文字・小文字や強調の記号は区別しない。
+    """
+    sections = [section for section in root.walk() if section is not root]
+    target = normalize(selector)
+    matched = [section for section in sections if normalize(section.title) == target]
+    if matched:
+        return matched
+
+    parts = [normalize(part) for part in selector.split(PATH_SEPARATOR) if part.strip()]
+    return [
+        section
+        for section in sections
+        if len(section.path) >= len(parts)
+        and [normalize(title) for title in section.path[-len(parts) :]] == parts
+    ]
+
+
+def select_sections(markdown: str, root: Section, selectors: list[str]) -> str:
+    selected: list[Section] = []
+    missing = []
+    for selector in selectors:
+        sections = find_sections(root, selector)
+        if not sections:
+            missing.append(selector)
+        selected += sections
+    if missing:
+        raise ValueError(
+            f"Sections {missing} were not found. Available sections: {outline(root)}"
+        )
+
+    # 選ばれた見出しの子孫が重ねて選ばれた場合は親の範囲だけを返す
+    ranges = []
+    for section in sorted(selected, key=lambda section: (section.start, -section.end)):
+        if ranges and section.end <= ranges[-1][1]:
+            continue
+        ranges.append((section.start, section.end))
+    return "\n".join(markdown[start:end].strip("\n") + "\n" for start, end in ranges)
+
+
+class SectionCache:
+    """
+    URIごとに見出しの木を保持する。markdownが変わった場合（docsの新しいversion）は作り直す。
+    同じ文字列のhashはPythonが文字列自体に保持するため、キャッシュ済みのmarkdownとの比較は全体を走査しない。
+    """
+
+    def __init__(self, max_entries: int = SOFTREEF_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[int, int, Section]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uri: str, markdown: str) -> Section:
+        version = (hash(markdown), len(markdown))
+        entry = self._entries.get(uri)
+        if entry is not None and entry[:2] == version:
+            self._entries.move_to_end(uri)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        root = parse_sections(markdown)
+        self._entries[uri] = (*version, root)
+        self._entries.move_to_end(uri)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return root
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+section_cache = SectionCache()
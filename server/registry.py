@@ -0,0 +1,42 @@
+from typing import Any, Awaitable, Callable, Generic, Protocol, TypeVar
+
+
+class Named(Protocol):
+    name: str
+
+
+D = TypeVar("D", bound=Named)
+Handler = Callable[[Any], Awaitable[Any]]
+
+
+class Registry(Generic[D]):
+    """
+    ToolやPromptの定義と処理をnameをkeyに登録する。
+    定義の一覧は登録時に1度だけ作り、呼び出し時はnameから辞書で処理を引く。
+    """
+
+    def __init__(self, not_found: str):
+        self.not_found = not_found
+        self.definitions: list[D] = []
+        self._handlers: dict[str, Handler] = {}
+
+    def register(self, definition: D, listed: bool = True) -> Callable[[Handler], Handler]:
+        """
+        listedがFalseの場合は呼び出せるが一覧には含めない。
+        """
+
+        def decorator(handler: Handler) -> Handler:
+            if definition.name in self._handlers:
+                raise ValueError(f"{definition.name} is already registered")
+            self._handlers[definition.name] = handler
+            if listed:
+                self.definitions.append(definition)
+            return handler
+
+        return decorator
+
+    async def call(self, name: str, arguments: Any) -> Any:
+        handler = self._handlers.get(name)
+        if handler is None:
+            raise ValueError(self.not_found.format(name=name))
+        return await handler(arguments)
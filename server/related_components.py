@@ -0,0 +1,104 @@
+import re
+import logging
+from collections import Counter
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("related_components")
+
+NGRAM_SIZES = (2, 3)
+NOISE_PATTERN = re.compile(r"[#*_`>|\[\](){}!\-:;,.、。・/\\\"'=<>]+")
+
+
+def char_ngrams(text: str) -> Counter:
+    """
+    記号を除いて空白を詰めた文字列から、文字のn-gramを数える。
+    日本語の説明文でも単語の区切りに依らずに似た表現を拾える。
+    """
+    text = " ".join(NOISE_PATTERN.sub(" ", text.lower()).split())
+    ngrams = Counter()
+    for size in NGRAM_SIZES:
+        ngrams.update(text[i : i + size] for i in range(len(text) - size + 1))
+    return ngrams
+
+
+def tfidf_matrix(texts: list[str]) -> np.ndarray:
+    """
+    文字n-gramのTF-IDF（sublinearなTF, smoothなIDF）を行ごとにL2正規化した行列を返す。
+    """
+    counts = [char_ngrams(text) for text in texts]
+    vocabulary: dict[str, int] = {}
+    for counter in counts:
+        for ngram in counter:
+            vocabulary.setdefault(ngram, len(vocabulary))
+
+    matrix = np.zeros((len(texts), len(vocabulary)), dtype=np.float32)
+    for row, counter in enumerate(counts):
+        columns = np.fromiter(
+            (vocabulary[ngram] for ngram in counter), dtype=np.int64, count=len(counter)
+        )
+        values = np.fromiter(counter.values(), dtype=np.float32, count=len(counter))
+        matrix[row, columns] = 1 + np.log(values)
+
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    matrix *= np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class RelatedComponents:
+    """
+    docsの文字n-gramのTF-IDFの行列を保持し、cosine類似度で関連するdocsを返す。
+    行列はcorpusのversionが変わった場合（docsが描画・更新された場合）にだけ作り直す。
+    """
+
+    def __init__(self):
+        # (URIの一覧, URIから行への対応, 行列, version)。検索中に差し替わっても崩れないよう1つにまとめる
+        self._state: tuple[list[str], dict[str, int], np.ndarray, object] | None = None
+        self.builds = 0
+
+    def is_current(self, version) -> bool:
+        return self._state is not None and self._state[3] == version
+
+    def build(self, documents: dict[str, str], version):
+        """
+        event loopの外で実行できるよう、作った行列はまとめて差し替える。
+        """
+        uris = list(documents)
+        matrix = tfidf_matrix([documents[uri] for uri in uris])
+        positions = {uri: position for position, uri in enumerate(uris)}
+        self._state = (uris, positions, matrix, version)
+        self.builds += 1
+        logger.info(f"Built a {matrix.shape[0]}x{matrix.shape[1]} TF-IDF matrix")
+
+    def related(self, uri: str, limit: int = 5) -> list[tuple[str, float]]:
+        if self._state is None:
+            raise ValueError("The corpus has not been built yet")
+        uris, positions, matrix, _ = self._state
+        position = positions.get(uri)
+        if position is None:
+            raise ValueError(f"{uri} is not included in the corpus")
+
+        similarities = matrix @ matrix[position]
+        similarities[position] = -np.inf
+
+        limit = min(limit, len(uris) - 1)
+        if limit <= 0:
+            return []
+        top = np.argpartition(-similarities, limit - 1)[:limit]
+        top = top[np.argsort(-similarities[top])]
+        return [
+            (uris[index], float(similarities[index]))
+            for index in top
+            if np.isfinite(similarities[index])
+        ]
+
+    def stats(self) -> dict:
+        documents, features = (
+            self._state[2].shape if self._state is not None else (0, 0)
+        )
+        return {"documents": documents, "features": features, "builds": self.builds}
+
+
+related_components = RelatedComponents()
@@ -0,0 +1,219 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Iterator
+from dotenv import load_dotenv
+
+from browser_manager import SOFTREEF_PAGE_POOL_SIZE
+from render_workers import SOFTREEF_RENDER_WORKERS
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("render_scheduler")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    PROMPT = 1
+    PREFETCH = 2
+    REVALIDATION = 3
+
+    @property
+    def is_background(self) -> bool:
+        return self >= Priority.PREFETCH
+
+
+def parse_limits(value: str) -> dict[Priority, int]:
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, limit = item.split("=")
+        limits[Priority[name.strip().upper()]] = int(limit)
+    return limits
+
+
+# render workerを使う場合は、各workerのpage poolの合計まで同時に描画する
+SOFTREEF_RENDER_CONCURRENCY = int(
+    os.getenv(
+        "SOFTREEF_RENDER_CONCURRENCY",
+        str(SOFTREEF_PAGE_POOL_SIZE * max(SOFTREEF_RENDER_WORKERS, 1)),
+    )
+)
+SOFTREEF_RENDER_LIMITS = parse_limits(
+    os.getenv("SOFTREEF_RENDER_LIMITS", "prefetch=1,revalidation=1")
+)
+SOFTREEF_RENDER_BACKGROUND_RESERVE = int(
+    os.getenv("SOFTREEF_RENDER_BACKGROUND_RESERVE", "1")
+)
+
+# 描画を要求した処理の優先度とkey（resourceのURI）。SingleFlightのtaskにも引き継がれる
+render_job: ContextVar[tuple[Priority, str | None]] = ContextVar(
+    "render_job", default=(Priority.INTERACTIVE, None)
+)
+
+
+@contextmanager
+def prioritized(priority: Priority, key: str | None = None) -> Iterator[None]:
+    token = render_job.set((priority, key))
+    try:
+        yield
+    finally:
+        render_job.reset(token)
+
+
+@dataclass(order=True)
+class Waiter:
+    priority: Priority
+    sequence: int
+    key: str | None = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class RenderScheduler:
+    """
+    ブラウザでの描画の実行枠を優先度順に割り当てる。
+    優先度ごとに同時実行数の上限を持ち、prefetch・revalidationはinteractive・promptの描画が待っている間や、
+    空いている枠がbackground_reserve以下の間は開始せずに後回しにする。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = SOFTREEF_RENDER_CONCURRENCY,
+        limits: dict[Priority, int] = SOFTREEF_RENDER_LIMITS,
+        background_reserve: int = SOFTREEF_RENDER_BACKGROUND_RESERVE,
+        window: int = 1000,
+    ):
+        self.concurrency = concurrency
+        self.limits = {
+            priority: min(limits.get(priority, concurrency), concurrency)
+            for priority in Priority
+        }
+        self.background_reserve = min(background_reserve, concurrency - 1)
+        self._waiters: list[Waiter] = []
+        self._running = {priority: 0 for priority in Priority}
+        self._sequence = itertools.count()
+        self._queue_latencies = {priority: deque(maxlen=window) for priority in Priority}
+        self.completed = {priority: 0 for priority in Priority}
+        self.promoted = 0
+
+    @property
+    def in_use(self) -> int:
+        return sum(self._running.values())
+
+    def _admissible(self, priority: Priority, foreground_waiting: bool) -> bool:
+        if self.in_use >= self.concurrency:
+            return False
+        if self._running[priority] >= self.limits[priority]:
+            return False
+        if priority.is_background:
+            if foreground_waiting:
+                return False
+            if self.in_use >= self.concurrency - self.background_reserve:
+                return False
+        return True
+
+    def _dispatch(self):
+        self._waiters = [waiter for waiter in self._waiters if not waiter.future.done()]
+        self._waiters.sort()
+        foreground_waiting = False
+        for waiter in list(self._waiters):
+            if self._admissible(waiter.priority, foreground_waiting):
+                self._running[waiter.priority] += 1
+                waiter.future.set_result(None)
+                self._waiters.remove(waiter)
+            elif not waiter.priority.is_background:
+                # 上限に達したclassの描画も、後ろのbackgroundの描画より先に枠を受け取る
+                foreground_waiting = True
+
+    def promote(self, key: str, priority: Priority):
+        """
+        keyの描画が低い優先度で待っている場合に優先度を引き上げる。
+        prefetch中のdocsをtool呼び出しが待つような優先度の逆転を防ぐ。
+        """
+        for waiter in self._waiters:
+            if waiter.key == key and waiter.priority > priority:
+                waiter.priority = priority
+                self.promoted += 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Priority]:
+        priority, key = render_job.get()
+        started = time.perf_counter()
+        waiter = Waiter(
+            priority=priority,
+            sequence=next(self._sequence),
+            key=key,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(waiter.priority)
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            raise
+
+        # promoteされた場合は引き上げられた優先度で枠を持つ
+        priority = waiter.priority
+        wait = time.perf_counter() - started
+        self._queue_latencies[priority].append(wait)
+        if wait > 1.0:
+            logger.info(f"Waited {wait:.2f}s for a {priority.name.lower()} render")
+        try:
+            yield priority
+        finally:
+            self.completed[priority] += 1
+            self._release(priority)
+
+    def _release(self, priority: Priority):
+        self._running[priority] -= 1
+        self._dispatch()
+
+    def stats(self) -> dict:
+        classes = {}
+        for priority in Priority:
+            latencies = sorted(self._queue_latencies[priority])
+
+            def percentile(ratio: float) -> float | None:
+                if not latencies:
+                    return None
+                index = min(int(len(latencies) * ratio), len(latencies) - 1)
+                return round(latencies[index] * 1000, 1)
+
+            classes[priority.name.lower()] = {
+                "running": self._running[priority],
+                "waiting": sum(
+                    1 for waiter in self._waiters if waiter.priority == priority
+                ),
+                "limit": self.limits[priority],
+                "completed": self.completed[priority],
+                "queue_p50_ms": percentile(0.5),
+                "queue_p99_ms": percentile(0.99),
+                "queue_max_ms": (
+                    round(latencies[-1] * 1000, 1) if latencies else None
+                ),
+            }
+        return {
+            "concurrency": self.concurrency,
+            "in_use": self.in_use,
+            "background_reserve": self.background_reserve,
+            "promoted": self.promoted,
+            "classes": classes,
+        }
+
+
+render_scheduler = RenderScheduler()
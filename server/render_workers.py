@@ -0,0 +1,339 @@
+import os
+import signal
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import AsyncIterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("render_workers")
+
+SOFTREEF_RENDER_WORKERS = int(os.getenv("SOFTREEF_RENDER_WORKERS", "0"))
+SOFTREEF_RENDER_WORKER_MAX_JOBS = int(
+    os.getenv("SOFTREEF_RENDER_WORKER_MAX_JOBS", "200")
+)
+SOFTREEF_RENDER_WORKER_MAX_RESTARTS = int(
+    os.getenv("SOFTREEF_RENDER_WORKER_MAX_RESTARTS", "5")
+)
+SOFTREEF_RENDER_WORKER_SHUTDOWN_TIMEOUT = float(
+    os.getenv("SOFTREEF_RENDER_WORKER_SHUTDOWN_TIMEOUT", "10")
+)
+
+
+class RenderWorkerError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class RenderRequest:
+    job_id: int
+    url: str
+    locator_id: str
+    anchor_class_name: str
+    block_resources: bool
+    readiness: str
+
+
+def send(conn: Connection, message) -> bool:
+    try:
+        conn.send(message)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def worker_main(conn: Connection):
+    """
+    render workerのprocessのentry point。Ctrl-Cは親のprocessが受け取り、終了を指示する。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(conn))
+
+
+async def serve(conn: Connection):
+    """
+    親から届いたRenderRequestを並行して描画し、iframeごとのmarkdownを(job_id, kind, payload)で送り返す。
+    Noneを受け取るか親との接続が切れたら、描画中のjobを終えてから終了する。
+    """
+    from browser_manager import PagePoolTimeoutError, browser_manager, page_pool
+    from storybook_async_fetcher import shutdown_converter, stream_docs_markdown
+
+    loop = asyncio.get_running_loop()
+    requests: asyncio.Queue[RenderRequest | None] = asyncio.Queue()
+
+    def receive():
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = None
+            loop.call_soon_threadsafe(requests.put_nowait, message)
+            if message is None:
+                return
+
+    threading.Thread(target=receive, name="render_worker_receiver", daemon=True).start()
+
+    async def render(request: RenderRequest):
+        try:
+            async for markdown in stream_docs_markdown(
+                request.url,
+                request.locator_id,
+                request.anchor_class_name,
+                request.block_resources,
+                request.readiness,
+            ):
+                send(conn, (request.job_id, "chunk", markdown))
+            send(conn, (request.job_id, "done", None))
+        except PagePoolTimeoutError as e:
+            send(conn, (request.job_id, "timeout", str(e)))
+        except Exception as e:
+            send(conn, (request.job_id, "error", str(e)))
+
+    tasks: set[asyncio.Task] = set()
+    try:
+        while (request := await requests.get()) is not None:
+            task = asyncio.create_task(render(request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await page_pool.close()
+        await browser_manager.close()
+        shutdown_converter()
+        conn.close()
+
+
+@dataclass
+class RenderWorker:
+    index: int
+    process: BaseProcess
+    conn: Connection
+    jobs: dict[int, asyncio.Queue] = field(default_factory=dict)
+    dispatched: int = 0
+    draining: bool = False
+
+
+class RenderWorkerPool:
+    """
+    markdown_format_textの描画を、それぞれがChromiumを持つ複数のprocessに振り分ける。
+    jobは実行中のjobが最も少ないworkerに送り、結果はiframeごとにpipeで受け取る。
+    max_jobs回描画したworkerは新しいworkerと入れ替え、異常終了したworkerはmax_restarts回まで起動し直す。
+    """
+
+    def __init__(
+        self,
+        size: int = SOFTREEF_RENDER_WORKERS,
+        max_jobs: int = SOFTREEF_RENDER_WORKER_MAX_JOBS,
+        max_restarts: int = SOFTREEF_RENDER_WORKER_MAX_RESTARTS,
+        shutdown_timeout: float = SOFTREEF_RENDER_WORKER_SHUTDOWN_TIMEOUT,
+    ):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_restarts = max_restarts
+        self.shutdown_timeout = shutdown_timeout
+        # 親のevent loopやthreadを引き継がないよう、forkではなくspawnで起動する
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: list[RenderWorker] = []
+        self._job_ids = itertools.count()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._started = False
+        self._closing = False
+        self.completed = 0
+        self.failed = 0
+        self.recycled = 0
+        self.crashes = 0
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        workerを使わない設定の場合や、全てのworkerが再起動の上限に達した場合はFalse
+        """
+        if self.size <= 0 or self._closing:
+            return False
+        return not self._started or any(not w.draining for w in self._workers)
+
+    def _start(self):
+        self._loop = asyncio.get_running_loop()
+        self._started = True
+        for index in range(self.size):
+            self._spawn(index)
+        logger.info(f"Started {self.size} render workers")
+
+    def _spawn(self, index: int):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=worker_main, args=(child_conn,), name=f"render_worker_{index}"
+        )
+        process.start()
+        child_conn.close()
+        worker = RenderWorker(index=index, process=process, conn=parent_conn)
+        self._workers.append(worker)
+        threading.Thread(
+            target=self._receive,
+            args=(worker,),
+            name=f"render_worker_{index}_receiver",
+            daemon=True,
+        ).start()
+
+    def _receive(self, worker: RenderWorker):
+        """
+        workerからの結果を別threadで受け取り、event loopに渡す。接続が切れたらworkerの終了として扱う。
+        """
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, worker, message)
+            except RuntimeError:
+                return
+        try:
+            self._loop.call_soon_threadsafe(self._on_exit, worker)
+        except RuntimeError:
+            pass
+
+    def _deliver(self, worker: RenderWorker, message: tuple[int, str, str | None]):
+        job_id, kind, payload = message
+        queue = worker.jobs.get(job_id)
+        if queue is not None:
+            queue.put_nowait((kind, payload))
+
+    def _on_exit(self, worker: RenderWorker):
+        if worker not in self._workers:
+            return
+        self._workers.remove(worker)
+        worker.conn.close()
+        for queue in worker.jobs.values():
+            queue.put_nowait(
+                ("error", f"Render worker {worker.process.pid} exited during rendering")
+            )
+        worker.jobs.clear()
+
+        if self._closing or worker.draining:
+            return
+        self.crashes += 1
+        if self.restarts >= self.max_restarts:
+            logger.error(
+                f"Render worker {worker.process.pid} exited and will not be restarted "
+                f"(restarts: {self.restarts})"
+            )
+            return
+        self.restarts += 1
+        logger.warning(
+            f"Render worker {worker.process.pid} exited unexpectedly. "
+            f"Restarting it (restarts: {self.restarts})"
+        )
+        self._spawn(worker.index)
+
+    def _choose(self) -> RenderWorker:
+        if not self._started:
+            self._start()
+        candidates = [w for w in self._workers if not w.draining]
+        if not candidates:
+            raise RenderWorkerError("No render worker is available")
+        return min(candidates, key=lambda w: len(w.jobs))
+
+    def _dispatched(self, worker: RenderWorker):
+        worker.dispatched += 1
+        if self.max_jobs <= 0 or worker.dispatched < self.max_jobs:
+            return
+        # 受け付けたjobを描画し終えてから終了するよう指示し、代わりのworkerを先に起動しておく
+        worker.draining = True
+        self.recycled += 1
+        send(worker.conn, None)
+        self._spawn(worker.index)
+
+    async def stream(
+        self,
+        url: str,
+        locator_id: str,
+        anchor_class_name: str,
+        block_resources: bool,
+        readiness: str,
+    ) -> AsyncIterator[str]:
+        """
+        workerで描画し、iframeごとのmarkdownを届いた順に返す。
+        """
+        from browser_manager import PagePoolTimeoutError
+
+        worker = self._choose()
+        job_id = next(self._job_ids)
+        queue: asyncio.Queue[tuple[str, str | None]] = asyncio.Queue()
+        worker.jobs[job_id] = queue
+        try:
+            request = RenderRequest(
+                job_id, url, locator_id, anchor_class_name, block_resources, readiness
+            )
+            if not send(worker.conn, request):
+                raise RenderWorkerError(
+                    f"Render worker {worker.process.pid} is not accepting jobs"
+                )
+            self._dispatched(worker)
+
+            while True:
+                kind, payload = await queue.get()
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    self.completed += 1
+                    return
+                else:
+                    self.failed += 1
+                    if kind == "timeout":
+                        raise PagePoolTimeoutError(payload)
+                    raise RenderWorkerError(payload)
+        finally:
+            worker.jobs.pop(job_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "enabled": self.enabled,
+            "workers": [
+                {
+                    "pid": w.process.pid,
+                    "in_flight": len(w.jobs),
+                    "dispatched": w.dispatched,
+                    "draining": w.draining,
+                }
+                for w in self._workers
+            ],
+            "completed": self.completed,
+            "failed": self.failed,
+            "recycled": self.recycled,
+            "crashes": self.crashes,
+            "restarts": self.restarts,
+        }
+
+    async def close(self):
+        self._closing = True
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            send(worker.conn, None)
+
+        def join(process: BaseProcess):
+            process.join(self.shutdown_timeout)
+            if process.is_alive():
+                logger.warning(f"Render worker {process.pid} did not exit. Terminating it")
+                process.terminate()
+                process.join()
+
+        await asyncio.gather(
+            *[asyncio.to_thread(join, worker.process) for worker in workers]
+        )
+        for worker in workers:
+            worker.conn.close()
+
+
+render_worker_pool = RenderWorkerPool()
@@ -0,0 +1,78 @@
+import os
+import json
+import base64
+import hashlib
+import binascii
+import logging
+from typing import Any, Mapping
+from dotenv import load_dotenv
+from mcp.types import Resource
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("resource_catalog")
+
+SOFTREEF_RESOURCES_PAGE_SIZE = int(os.getenv("SOFTREEF_RESOURCES_PAGE_SIZE", "0"))
+
+
+class ResourceCatalog:
+    """
+    `resources/list`で返すResourceの一覧を初回に1度だけ作り、以降は使い回す。
+    page_sizeが1以上の場合はcursorで区切って返す。
+    cursorには一覧のURIから作ったversionを含め、一覧が異なるサーバーのcursorはエラーにする。
+    """
+
+    def __init__(
+        self,
+        sources: list[tuple[Mapping[str, Any], str]],
+        page_size: int = SOFTREEF_RESOURCES_PAGE_SIZE,
+    ):
+        self.sources = sources
+        self.page_size = page_size
+        self.version: str | None = None
+        self._resources: list[Resource] | None = None
+
+    @property
+    def resources(self) -> list[Resource]:
+        if self._resources is None:
+            self._resources = [
+                Resource(
+                    uri=uri,
+                    name=value.name,
+                    description=value.description,
+                    mimeType=mime_type,
+                )
+                for mapping, mime_type in self.sources
+                for uri, value in mapping.items()
+            ]
+            uris = "\n".join(str(resource.uri) for resource in self._resources)
+            self.version = hashlib.sha256(uris.encode("utf-8")).hexdigest()[:16]
+            logger.debug(
+                f"Built {len(self._resources)} resources (version {self.version})"
+            )
+        return self._resources
+
+    def encode_cursor(self, offset: int) -> str:
+        payload = json.dumps({"version": self.version, "offset": offset})
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, cursor: str) -> int:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            version, offset = payload["version"], payload["offset"]
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if version != self.version or not isinstance(offset, int) or offset < 0:
+            raise ValueError(f"Expired cursor was given: {cursor}")
+        return offset
+
+    def page(self, cursor: str | None = None) -> tuple[list[Resource], str | None]:
+        resources = self.resources
+        offset = self.decode_cursor(cursor) if cursor else 0
+        if self.page_size <= 0:
+            return resources[offset:], None
+
+        end = offset + self.page_size
+        next_cursor = self.encode_cursor(end) if end < len(resources) else None
+        return resources[offset:end], next_cursor
@@ -0,0 +1,158 @@
+import re
+import math
+import logging
+from collections import Counter
+from dataclasses import dataclass
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("search_index")
+
+WORD_PATTERN = re.compile(
+    r"[a-z0-9_]+|[぀-ゟ]+|[゠-ヿㇰ-ㇿｦ-ﾟ]+|[㐀-䶿一-鿿]+"
+)
+MARKUP_PATTERN = re.compile(r"[#*_`>|\[\]()!-]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    英数字は単語ごと、日本語は文字種が同じ連続部分を2文字ずつ（1文字の場合はその文字）に区切る。
+    形態素解析を使わずに「ボタン」と「ボタンの」のような部分一致を拾うため。
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word.isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens += [word[i : i + 2] for i in range(len(word) - 1)]
+    return tokens
+
+
+@dataclass
+class IndexedDocument:
+    title: str
+    text: str
+    term_frequencies: Counter
+    length: int
+    version: tuple[int, int]
+
+
+def prepare(title: str, text: str) -> IndexedDocument:
+    """
+    indexへの追加に必要なtokenの集計を行う。event loopの外で実行できる。
+    """
+    term_frequencies = Counter(tokenize(f"{title}\n{text}"))
+    return IndexedDocument(
+        title=title,
+        text=text,
+        term_frequencies=term_frequencies,
+        length=sum(term_frequencies.values()),
+        version=(hash(text), len(text)),
+    )
+
+
+class SearchIndex:
+    """
+    描画済みのmarkdownに対するBM25の転置index。
+    docsが描画し直された場合はそのdocsのpostingだけを入れ替える。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents: dict[str, IndexedDocument] = {}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._total_length = 0
+        self.updates = 0
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self._documents
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def is_current(self, uri: str, text: str) -> bool:
+        document = self._documents.get(uri)
+        return document is not None and document.version == (hash(text), len(text))
+
+    def update(self, uri: str, title: str, text: str):
+        if self.is_current(uri, text):
+            return
+        self.add(uri, prepare(title, text))
+
+    def add(self, uri: str, document: IndexedDocument):
+        self.remove(uri)
+        self._documents[uri] = document
+        self._total_length += document.length
+        for term, frequency in document.term_frequencies.items():
+            self._postings.setdefault(term, {})[uri] = frequency
+        self.updates += 1
+
+    def remove(self, uri: str) -> bool:
+        document = self._documents.pop(uri, None)
+        if document is None:
+            return False
+        self._total_length -= document.length
+        for term in document.term_frequencies:
+            postings = self._postings[term]
+            del postings[uri]
+            if not postings:
+                del self._postings[term]
+        return True
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        if not self._documents:
+            return []
+        count = len(self._documents)
+        average_length = self._total_length / count or 1.0
+        scores: Counter[str] = Counter()
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for uri, frequency in postings.items():
+                length = self._documents[uri].length
+                scores[uri] += idf * (
+                    frequency
+                    * (self.k1 + 1)
+                    / (frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+                )
+        return [(uri, score) for uri, score in scores.most_common(limit)]
+
+    def snippet(self, uri: str, query: str, width: int = 200) -> str:
+        """
+        queryのtokenを最も多く含む行を前後の行と共に返す。
+        """
+        terms = set(tokenize(query))
+        lines = [line.strip() for line in self._documents[uri].text.splitlines()]
+        best, best_score = 0, -1
+        for index, line in enumerate(lines):
+            if not line:
+                continue
+            score = len(terms & set(tokenize(line)))
+            if score > best_score:
+                best, best_score = index, score
+
+        text = " ".join(line for line in lines[max(best - 1, 0) : best + 2] if line)
+        text = MARKUP_PATTERN.sub(" ", text)
+        text = " ".join(text.split())
+        return text if len(text) <= width else text[:width] + "…"
+
+    def document(self, uri: str) -> IndexedDocument:
+        return self._documents[uri]
+
+    def documents(self) -> dict[str, IndexedDocument]:
+        return dict(self._documents)
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._documents),
+            "terms": len(self._postings),
+            "tokens": self._total_length,
+            "updates": self.updates,
+        }
+
+
+search_index = SearchIndex()
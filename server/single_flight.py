@@ -0,0 +1,50 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("single_flight")
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    同じkeyに対する処理が実行中であれば新たに実行せず、実行中の結果を共有する。
+    待っている呼び出し元がcancelされても、共有している処理自体はcancelしない。
+    """
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.get_running_loop().create_task(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joined in-flight fetch of {key}")
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 全ての呼び出し元がcancelされた場合でも例外を回収しておく
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Fetch of {key} failed: {task.exception()}")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
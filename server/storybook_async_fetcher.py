@@ -1,57 +1,329 @@
+import os
+import time
 import logging
 import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Literal
+from urllib.parse import urlsplit
 from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
 import html2text
+from dotenv import load_dotenv
+
+from browser_manager import PagePoolTimeoutError, browser_manager, page_pool
+from render_scheduler import render_scheduler
+from render_workers import render_worker_pool
+from storybook_request_filter import SOFTREEF_BLOCK_RESOURCES, request_filter
+from storybook_resources import Resource
+from storybook_static_fetcher import SOFTREEF_STATIC_FAST_PATH, static_storybook
+import storybook_markdown_converter
+
+if TYPE_CHECKING:
+    from playwright.async_api import Frame, Page
+
+load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("storybook_async_fetcher")
 
+Readiness = Literal["selector", "networkidle"]
 
-async def markdown_format_text(
-    url: str, locator_id: str = "storybook-docs", anchor_class_name: str = "sb-anchor"
+SOFTREEF_DOCS_READINESS: Readiness = os.getenv("SOFTREEF_DOCS_READINESS", "selector")
+SOFTREEF_DOCS_SETTLE_MS = int(os.getenv("SOFTREEF_DOCS_SETTLE_MS", "300"))
+SOFTREEF_DOCS_READY_TIMEOUT_MS = int(
+    os.getenv("SOFTREEF_DOCS_READY_TIMEOUT_MS", "15000")
+)
+SOFTREEF_DIRECT_IFRAME = os.getenv("SOFTREEF_DIRECT_IFRAME", "1") == "1"
+SOFTREEF_CONVERTER_EXECUTOR: Literal["thread", "process"] = os.getenv(
+    "SOFTREEF_CONVERTER_EXECUTOR", "thread"
+)
+SOFTREEF_CONVERTER_WORKERS = int(os.getenv("SOFTREEF_CONVERTER_WORKERS", "2"))
+SOFTREEF_MARKDOWN_CONVERTER: Literal["single-pass", "html2text"] = os.getenv(
+    "SOFTREEF_MARKDOWN_CONVERTER", "single-pass"
+)
+
+# 対象要素のDOMがsettle_ms以上変化しなくなるまで待つ。deadline_msを過ぎたらfalseを返す
+WAIT_FOR_STABLE_DOM = """
+([selector, settleMs, deadlineMs]) => new Promise((resolve) => {
+  const target = document.querySelector(selector);
+  let settleTimer;
+  let deadlineTimer;
+  const finish = (settled) => {
+    observer.disconnect();
+    clearTimeout(settleTimer);
+    clearTimeout(deadlineTimer);
+    resolve(settled);
+  };
+  const observer = new MutationObserver(() => {
+    clearTimeout(settleTimer);
+    settleTimer = setTimeout(() => finish(true), settleMs);
+  });
+  observer.observe(target, {
+    childList: true,
+    subtree: true,
+    characterData: true,
+    attributes: true,
+  });
+  settleTimer = setTimeout(() => finish(true), settleMs);
+  deadlineTimer = setTimeout(() => finish(false), deadlineMs);
+})
+"""
+
+
+async def wait_for_docs_ready(
+    frame: "Frame",
+    locator_id: str = "storybook-docs",
+    settle_ms: int = SOFTREEF_DOCS_SETTLE_MS,
+    deadline_ms: int = SOFTREEF_DOCS_READY_TIMEOUT_MS,
+) -> bool:
+    """
+    docsのiframe内で`#{locator_id}`に中身が描画され、DOMの変化が収まるまで待つ。
+    """
+    started = time.perf_counter()
+    await frame.wait_for_selector(
+        f"#{locator_id} > *", state="attached", timeout=deadline_ms
+    )
+    remaining_ms = max(
+        deadline_ms - int((time.perf_counter() - started) * 1000), settle_ms
+    )
+    settled = await frame.evaluate(
+        WAIT_FOR_STABLE_DOM, [f"#{locator_id}", settle_ms, remaining_ms]
+    )
+    if not settled:
+        logger.warning(
+            f"DOM of #{locator_id} did not settle within {deadline_ms}ms ({frame.url})"
+        )
+    return settled
+
+
+def html_to_markdown(
+    html: str,
+    anchor_class_name: str = "sb-anchor",
+    converter: Literal["single-pass", "html2text"] = SOFTREEF_MARKDOWN_CONVERTER,
 ) -> str:
-    markdown = ""
-    async with async_playwright() as p:
-        try:
-            browser = await p.chromium.launch(
-                headless=True,
-                executable_path="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+    if converter == "single-pass":
+        return storybook_markdown_converter.convert(html, anchor_class_name)
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    for el in soup.select(f".{anchor_class_name}"):
+        el.decompose()
+
+    return html2text.html2text(str(soup))
+
+
+_converter_executor: Executor | None = None
+
+
+def converter_executor() -> Executor:
+    global _converter_executor
+    if _converter_executor is None:
+        if SOFTREEF_CONVERTER_EXECUTOR == "process":
+            _converter_executor = ProcessPoolExecutor(
+                max_workers=SOFTREEF_CONVERTER_WORKERS
+            )
+        else:
+            _converter_executor = ThreadPoolExecutor(
+                max_workers=SOFTREEF_CONVERTER_WORKERS,
+                thread_name_prefix="markdown_converter",
             )
+    return _converter_executor
+
+
+def shutdown_converter():
+    global _converter_executor
+    if _converter_executor is not None:
+        _converter_executor.shutdown(wait=False, cancel_futures=True)
+        _converter_executor = None
+
+
+async def convert_html(html: str, anchor_class_name: str = "sb-anchor") -> str:
+    """
+    HTMLのparseとmarkdownへの変換はCPUを占有するため、event loopの外で実行する。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        converter_executor(), html_to_markdown, html, anchor_class_name
+    )
+
+
+async def frame_markdown(
+    frame: "Frame",
+    locator_id: str = "storybook-docs",
+    anchor_class_name: str = "sb-anchor",
+) -> str:
+    html = await frame.locator(f"#{locator_id}").inner_html()
+    return await convert_html(html, anchor_class_name)
+
 
-            page = await browser.new_page()
-            await page.goto(url)
-            await page.wait_for_load_state("networkidle")
+def is_iframe_url(url: str) -> bool:
+    return urlsplit(url).path.endswith("/iframe.html")
 
-            iframes = page.frames
-            storybook_iframes = [
-                iframe for iframe in iframes if iframe.name.startswith("storybook")
+
+def storybook_frames(page: "Page", url: str) -> list["Frame"]:
+    if is_iframe_url(url):
+        return [page.main_frame]
+    return [frame for frame in page.frames if frame.name.startswith("storybook")]
+
+
+async def load_docs_frames(
+    page: "Page", url: str, locator_id: str, readiness: Readiness
+) -> list["Frame"]:
+    if readiness == "networkidle":
+        await page.goto(url)
+        await page.wait_for_load_state("networkidle")
+        return storybook_frames(page, url)
+
+    await page.goto(url, wait_until="domcontentloaded")
+    try:
+        if is_iframe_url(url):
+            await wait_for_docs_ready(page.main_frame, locator_id)
+            return [page.main_frame]
+
+        await page.wait_for_selector(
+            "iframe[name^='storybook']",
+            state="attached",
+            timeout=SOFTREEF_DOCS_READY_TIMEOUT_MS,
+        )
+        storybook_iframes = [
+            frame for frame in page.frames if frame.name.startswith("storybook")
+        ]
+        for iframe in storybook_iframes:
+            await wait_for_docs_ready(iframe, locator_id)
+        return storybook_iframes
+    except Exception as e:
+        logger.warning(
+            f'Error "{str(e)}" was occurred during waiting for docs. '
+            "Falling back to networkidle."
+        )
+        await page.wait_for_load_state("networkidle")
+        return storybook_frames(page, url)
+
+
+async def stream_docs_markdown(
+    url: str,
+    locator_id: str = "storybook-docs",
+    anchor_class_name: str = "sb-anchor",
+    block_resources: bool = SOFTREEF_BLOCK_RESOURCES,
+    readiness: Readiness = SOFTREEF_DOCS_READINESS,
+) -> AsyncIterator[str]:
+    """
+    このprocessのブラウザでdocsを描画し、iframeごとのmarkdownを順に返す。
+    render workerのprocessではこれを直接呼び出す。
+    """
+    async with page_pool.page() as page:
+        if block_resources:
+            await page.route("**/*", request_filter.handle)
+        try:
+            started = time.perf_counter()
+            storybook_iframes = await load_docs_frames(
+                page, url, locator_id, readiness
+            )
+
+            conversions = [
+                asyncio.ensure_future(
+                    frame_markdown(iframe, locator_id, anchor_class_name)
+                )
+                for iframe in storybook_iframes
             ]
+            # 呼び出し側がchunkを処理する時間を含めないよう、変換を終えた時点で計測する。
+            # chunkはiframeの順に返すため、最初のchunkを返せるのは先頭のiframeの変換を終えた時
+            converted_at: dict[int, float] = {}
+            for index, conversion in enumerate(conversions):
+                conversion.add_done_callback(
+                    lambda _, index=index: converted_at.setdefault(
+                        index, time.perf_counter() - started
+                    )
+                )
+            try:
+                for conversion in conversions:
+                    yield await conversion
+            finally:
+                for conversion in conversions:
+                    conversion.cancel()
 
-            for iframe in storybook_iframes:
-                html = await iframe.locator(f"#{locator_id}").inner_html()
-                soup = BeautifulSoup(html, "html.parser")
+            if converted_at:
+                logger.info(
+                    f"Time to first markdown: {converted_at[0] * 1000:.0f}ms, "
+                    f"all markdown: {max(converted_at.values()) * 1000:.0f}ms "
+                    f"(iframes: {len(conversions)}, readiness: {readiness}, url: {url})"
+                )
+        finally:
+            if block_resources:
+                await page.unroute("**/*", request_filter.handle)
 
-                for el in soup.select(f".{anchor_class_name}"):
-                    el.decompose()
 
-                markdown += html2text.html2text(str(soup))
+async def markdown_format_text(
+    url: str,
+    locator_id: str = "storybook-docs",
+    anchor_class_name: str = "sb-anchor",
+    block_resources: bool = SOFTREEF_BLOCK_RESOURCES,
+    readiness: Readiness = SOFTREEF_DOCS_READINESS,
+) -> str:
+    """
+    SOFTREEF_RENDER_WORKERSが指定されている場合はrender workerで、それ以外はこのprocessで描画する。
+    """
+    chunks = []
+    async with render_scheduler.slot():
+        if render_worker_pool.enabled:
+            stream = render_worker_pool.stream(
+                url, locator_id, anchor_class_name, block_resources, readiness
+            )
+        else:
+            stream = stream_docs_markdown(
+                url, locator_id, anchor_class_name, block_resources, readiness
+            )
+        try:
+            async for markdown in stream:
+                chunks.append(markdown)
+        except PagePoolTimeoutError:
+            raise
         except Exception as e:
             logger.error(f'Error "{str(e)}" was occurred during fetching text')
-        finally:
-            await browser.close()
+            return ""
 
-    return markdown
+    return "".join(chunks)
+
+
+async def resource_markdown(
+    resource: Resource,
+    direct_iframe: bool = SOFTREEF_DIRECT_IFRAME,
+    static_fast_path: bool = SOFTREEF_STATIC_FAST_PATH,
+) -> str:
+    """
+    まずブラウザを使わずにMDXのソースから取得を試みる。
+    描画が必要な場合、story idが分かればiframe.htmlを直接開き、取得できなかった場合はmanagerのURLで取得し直す。
+    """
+    if static_fast_path:
+        markdown = await static_storybook.markdown(resource)
+        if markdown:
+            return markdown
+
+    if direct_iframe and resource.iframe_url is not None:
+        markdown = await markdown_format_text(url=resource.iframe_url)
+        if markdown:
+            return markdown
+        logger.warning(
+            f"No markdown was found in {resource.iframe_url}. "
+            "Falling back to the manager URL."
+        )
+    return await markdown_format_text(url=resource.url)
 
 
 if __name__ == "__main__":
     from storybook_resources import uri_2_resource
 
-    component = "Notification"
-    asyncio.run(
-        markdown_format_text(
-            url=uri_2_resource[
-                f"markdown://softreef/design-system/component/{component}"
-            ].url
-        )
-    )
+    async def run(component: str):
+        try:
+            return await resource_markdown(
+                uri_2_resource[
+                    f"markdown://softreef/design-system/component/{component}"
+                ]
+            )
+        finally:
+            await static_storybook.close()
+            await render_worker_pool.close()
+            await page_pool.close()
+            await browser_manager.close()
+            shutdown_converter()
+
+    asyncio.run(run("Notification"))
@@ -0,0 +1,395 @@
+"""
+storybookのdocsのHTMLを1回の走査でmarkdownに変換する。
+BeautifulSoupでparseした結果を文字列に戻し、html2textで再度parseする従来の変換と同じ書式で出力する。
+"""
+import re
+import string
+from html.parser import HTMLParser
+import html2text
+from html2text.utils import escape_md
+
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "aside",
+    "div",
+    "dl",
+    "dt",
+    "dd",
+    "figure",
+    "footer",
+    "form",
+    "header",
+    "main",
+    "nav",
+    "section",
+}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+EMPHASIS_TAGS = {
+    "strong": "**",
+    "b": "**",
+    "em": "_",
+    "i": "_",
+    "u": "_",
+    "del": "~~",
+    "s": "~~",
+    "strike": "~~",
+}
+
+BODY_WIDTH = html2text.config.BODY_WIDTH
+WHITESPACE_PATTERN = re.compile(r"[ \t\r\n\f]+")
+# 強調の直後の文字がこれに当たる場合、html2textは閉じる記号との間に空白を入れる
+AFTER_EMPHASIS_PATTERN = re.compile(r"[^][(){}\s.!?]")
+ABSOLUTE_URL_PATTERN = re.compile(r"^[a-zA-Z+]+://")
+
+
+class Link:
+    def __init__(self, href: str, title: str):
+        self.href = href
+        self.title = title
+        # 本文がhrefと同じ絶対URLの場合、html2textは`<url>`と出力する
+        self.automatic = False
+
+    def markdown(self) -> str:
+        title = f' "{escape_md(self.title)}"' if self.title.strip() else ""
+        return f"]({escape_md(self.href)}{title})"
+
+
+class Table:
+    def __init__(self):
+        self.rows: list[list[str]] = []
+        self.cell: list[str] | None = None
+
+    def markdown(self) -> str:
+        rows = [row for row in self.rows if row]
+        if not rows:
+            return ""
+        lines = ["| ".join(rows[0]) + "  ", "|".join(["---"] * len(rows[0])) + "  "]
+        lines += ["| ".join(row) + "  " for row in rows[1:]]
+        return "\n".join(lines)
+
+
+class StorybookMarkdownParser(HTMLParser):
+    def __init__(self, anchor_class_name: str = "sb-anchor"):
+        super().__init__(convert_charrefs=True)
+        self.anchor_class_name = anchor_class_name
+        self.out: list[str] = []
+        self._pending_breaks = 0
+        self._cell_break = False
+        self._break_quote_depth = 0
+        self._skip_depth = 0
+        self._skip_stack: list[str] = []
+        self._pre_depth = 0
+        self._pre: list[str] = []
+        self._lists: list[list] = []
+        self._links: list[Link | None] = []
+        # 開いたlinkの`[`の位置。最初のtextがhrefと同じであれば`<url>`に置き換える
+        self._link_start: tuple[list[str], int] | None = None
+        self._tables: list[Table] = []
+        self._quote_depth = 0
+        self._leading_blank = False
+        self._pre_end = -1
+        # liのmarkerを書いた直後。MDXのloose listは`<li><p>`になり、段落の改行でmarkerと本文が離れないようにする
+        self._item_start = False
+        # html2textと同じ位置で強調の前後に空白を入れるための状態
+        self._current_tag = ""
+        self._preceding_data = ""
+        self._stressed = False
+        self._preceding_stressed = False
+
+    @property
+    def _cell(self) -> list[str] | None:
+        return self._tables[-1].cell if self._tables else None
+
+    def _last(self) -> str:
+        target = self._cell if self._cell is not None else self.out
+        return target[-1] if target else ""
+
+    # 出力先はtableのcell内であればcellのbuffer、それ以外は全体のbuffer。
+    # cell内の改行はmarkdownの表を崩すため空白に置き換える
+    def _write(self, text: str):
+        if not text:
+            return
+        cell = self._cell
+        if cell is not None:
+            if self._cell_break and cell:
+                cell.append(" ")
+            self._cell_break = False
+            cell.append(text)
+            return
+
+        if self._pending_breaks and self.out:
+            blank = "> " * min(self._break_quote_depth, self._quote_depth)
+            self.out.append(("\n" + blank) * (self._pending_breaks - 1))
+            self.out.append("\n" + "> " * self._quote_depth)
+        elif not self.out and self._quote_depth:
+            self.out.append("> " * self._quote_depth)
+        self._pending_breaks = 0
+        self._item_start = False
+        self.out.append(text)
+
+    def _break(self, count: int):
+        # html2textと同様に、cell内のblock要素の境界では何も挟まない
+        if self._cell is not None:
+            return
+        if not self._pending_breaks:
+            self._break_quote_depth = self._quote_depth
+        self._pending_breaks = max(self._pending_breaks, count)
+
+    def _is_anchor(self, attrs: list[tuple[str, str | None]]) -> bool:
+        for name, value in attrs:
+            if name == "class" and value and self.anchor_class_name in value.split():
+                return True
+        return False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._skip_stack.append(tag)
+                self._skip_depth += 1
+            return
+        if tag in SKIPPED_TAGS or self._is_anchor(attrs):
+            if tag not in VOID_TAGS:
+                self._skip_stack.append(tag)
+                self._skip_depth = 1
+            return
+
+        if self._pre_depth:
+            if tag == "pre":
+                self._pre_depth += 1
+            elif tag == "br":
+                self._pre.append("\n")
+            return
+
+        self._current_tag = tag
+        if tag in HEADING_TAGS:
+            self._break(2)
+            self._write("#" * HEADING_TAGS[tag] + " ")
+        elif tag == "p":
+            if not self._item_start:
+                self._break(2)
+        elif tag in BLOCK_TAGS:
+            self._break(1)
+        elif tag == "br":
+            if self._cell is None:
+                self._write("  ")
+                self._break(1)
+            else:
+                self._cell_break = True
+        elif tag == "hr":
+            self._break(2)
+            self._write("* * *")
+            self._break(2)
+        elif tag in EMPHASIS_TAGS:
+            self._write(self._emphasis_start(EMPHASIS_TAGS[tag]))
+            self._stressed = True
+        elif tag == "code":
+            self._write("`")
+        elif tag == "pre":
+            self._pre_depth = 1
+            self._pre = []
+        elif tag == "blockquote":
+            self._break(2)
+            self._quote_depth += 1
+        elif tag in ["ul", "ol"]:
+            if not self._lists:
+                self._break(2)
+            self._lists.append([tag, 0])
+        elif tag == "li":
+            self._break(1)
+            depth = max(len(self._lists), 1)
+            marker = "*"
+            if self._lists and self._lists[-1][0] == "ol":
+                self._lists[-1][1] += 1
+                marker = f"{self._lists[-1][1]}."
+            self._write("  " * depth + marker + " ")
+            self._item_start = self._cell is None
+        elif tag == "a":
+            attributes = dict(attrs)
+            href = attributes.get("href")
+            if href and not href.startswith("#"):
+                self._links.append(Link(href, attributes.get("title") or ""))
+                self._write("[")
+                target = self._cell if self._cell is not None else self.out
+                self._link_start = (target, len(target) - 1)
+            else:
+                self._links.append(None)
+        elif tag == "img":
+            attributes = dict(attrs)
+            if attributes.get("src"):
+                self._write(f"![{attributes.get('alt') or ''}]({attributes['src']})")
+        elif tag == "table":
+            self._break(2)
+            self._tables.append(Table())
+        elif tag == "tr" and self._tables:
+            self._tables[-1].rows.append([])
+        elif tag in ["td", "th"] and self._tables:
+            table = self._tables[-1]
+            if not table.rows:
+                table.rows.append([])
+            table.cell = []
+            self._cell_break = False
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str):
+        if self._skip_depth:
+            if tag in self._skip_stack:
+                while self._skip_stack:
+                    self._skip_depth -= 1
+                    if self._skip_stack.pop() == tag:
+                        break
+            return
+
+        if self._pre_depth:
+            if tag == "pre":
+                self._pre_depth -= 1
+                if not self._pre_depth:
+                    self._flush_pre()
+            return
+
+        self._current_tag = tag
+        if tag in HEADING_TAGS or tag == "p":
+            self._break(2)
+        elif tag in BLOCK_TAGS:
+            self._break(1)
+        elif tag in EMPHASIS_TAGS:
+            self._write(EMPHASIS_TAGS[tag])
+        elif tag == "code":
+            self._write("`")
+        elif tag == "blockquote":
+            self._quote_depth = max(self._quote_depth - 1, 0)
+            self._break(2)
+        elif tag in ["ul", "ol"]:
+            if self._lists:
+                self._lists.pop()
+            self._break(2 if not self._lists else 1)
+        elif tag == "li":
+            self._break(1)
+        elif tag == "a":
+            link = self._links.pop() if self._links else None
+            self._link_start = None
+            if link is not None and not link.automatic:
+                self._write(link.markdown())
+        elif tag in ["td", "th"] and self._tables:
+            table = self._tables[-1]
+            if table.cell is not None:
+                table.rows[-1].append("".join(table.cell).strip())
+                table.cell = None
+        elif tag == "table" and self._tables:
+            table = self._tables.pop()
+            self._write(table.markdown())
+            self._break(2)
+
+    def _emphasis_start(self, mark: str) -> str:
+        """
+        html2textは直前の文字と続けると強調として解釈されない場合に、開く記号の前に空白を入れる。
+        """
+        last = self._preceding_data[-1:]
+        if mark == "_":
+            separate = last and last not in string.whitespace + string.punctuation
+        else:
+            separate = last == mark[0]
+        if separate:
+            self._preceding_data += " "
+            return " " + mark
+        return mark
+
+    def handle_data(self, data: str):
+        if self._skip_depth:
+            return
+        if self._pre_depth:
+            self._pre.append(data)
+            return
+
+        if self._stressed:
+            data = data.strip()
+            self._stressed = False
+            self._preceding_stressed = True
+        elif self._preceding_stressed:
+            if (
+                AFTER_EMPHASIS_PATTERN.match(data[0])
+                and self._current_tag not in HEADING_TAGS
+                and self._current_tag not in ["a", "code", "pre"]
+            ):
+                data = " " + data
+            self._preceding_stressed = False
+        if self._link_start is not None:
+            target, index = self._link_start
+            self._link_start = None
+            link = self._links[-1]
+            if (
+                data == link.href
+                and ABSOLUTE_URL_PATTERN.match(data)
+                and index == len(target) - 1
+            ):
+                target[index] = f"<{data}>"
+                link.automatic = True
+                self._preceding_data = data
+                return
+        if not data:
+            return
+        self._preceding_data = data
+
+        text = WHITESPACE_PATTERN.sub(" ", data)
+        breaking = self._cell_break if self._cell is not None else self._pending_breaks
+        last = self._last()
+        if not text.strip():
+            if text and last and not breaking and not last.endswith((" ", "\n")):
+                self._write(" ")
+            return
+        if breaking or not last or last.endswith((" ", "\n")):
+            text = text.lstrip()
+        self._write(text)
+
+    def _flush_pre(self):
+        code = "".join(self._pre).strip("\n")
+        self._pre = []
+        # html2textはcode blockの前に空白だけの行を2行出力する。
+        # docsの先頭では空行を1行だけ出力し、code blockが続く場合は間に空行を入れない
+        lines = ["", ""] + code.split("\n")
+        separator = ""
+        if not self.out and self._cell is None:
+            self._leading_blank = True
+            lines = lines[2:]
+        elif self._pre_end == len(self.out) and self._cell is None:
+            self._pending_breaks = 0
+            separator = "\n"
+        else:
+            self._break(2)
+        self._write(separator + "\n".join("    " + line for line in lines))
+        self._pre_end = len(self.out)
+        self._break(2)
+
+    def markdown(self) -> str:
+        text = "".join(self.out).strip("\n") + "\n\n"
+        if self._leading_blank:
+            text = "\n" + text
+        # 段落の折り返しはhtml2textの実装をそのまま使い、従来の変換と同じ位置で折り返す
+        return html2text.HTML2Text(bodywidth=BODY_WIDTH).optwrap(text)
+
+
+def convert(html: str, anchor_class_name: str = "sb-anchor") -> str:
+    parser = StorybookMarkdownParser(anchor_class_name)
+    parser.feed(html)
+    parser.close()
+    return parser.markdown()
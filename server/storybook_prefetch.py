@@ -0,0 +1,157 @@
+import os
+import json
+import asyncio
+import logging
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from disk_cache import SOFTREEF_CACHE_DIR
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("storybook_prefetch")
+
+SOFTREEF_WARMUP = os.getenv("SOFTREEF_WARMUP", "0") == "1"
+SOFTREEF_WARMUP_LIMIT = int(os.getenv("SOFTREEF_WARMUP_LIMIT", "20"))
+SOFTREEF_WARMUP_IDLE_POLL = float(os.getenv("SOFTREEF_WARMUP_IDLE_POLL", "0.2"))
+
+
+class AccessFrequency:
+    """
+    URIごとの参照回数をファイルに保存し、次回起動時のwarm-upの順序に使う。
+    複数のサーバーが同じファイルを更新しても回数を失わないよう、保存時はlock fileを排他的にlockした上で、
+    前回保存以降の差分を加算する。fcntlの無い環境（Windows）ではlockせずに加算する。
+    """
+
+    def __init__(self, path: Path, save_every: int = 10):
+        self.path = path
+        self.save_every = save_every
+        self._pending: Counter[str] = Counter()
+
+    def load(self) -> Counter[str]:
+        try:
+            return Counter(json.loads(self.path.read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            return Counter()
+        except (OSError, ValueError) as e:
+            logger.warning(f"{str(e)} was occurred during loading {self.path}")
+            return Counter()
+
+    def record(self, uri: str) -> bool:
+        """
+        参照を記録し、保存すべき件数が溜まった場合はTrueを返す。
+        """
+        self._pending[uri] += 1
+        return self._pending.total() >= self.save_every
+
+    def take(self) -> Counter[str]:
+        pending, self._pending = self._pending, Counter()
+        return pending
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        読み込みから書き込みまでの間に、他のprocessが保存した回数を上書きしないようにする。
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(f"{self.path.name}.lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def save(self, pending: Counter[str] | None = None):
+        """
+        前回保存以降の参照回数をファイルに加算する。
+        event loopの外で書き込む場合は、loop上でtake()した差分を渡す。
+        """
+        pending = self.take() if pending is None else pending
+        if not pending:
+            return
+        try:
+            with self._locked():
+                counts = self.load() + pending
+                temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                temporary.write_text(json.dumps(dict(counts), ensure_ascii=False))
+                os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"{str(e)} was occurred during saving {self.path}")
+
+    def ordered(self, uris: list[str], limit: int = SOFTREEF_WARMUP_LIMIT) -> list[str]:
+        counts = self.load() + self._pending
+        ranked = sorted(
+            (uri for uri in uris if counts[uri] > 0), key=lambda uri: -counts[uri]
+        )
+        return ranked[:limit]
+
+
+class Prefetcher:
+    """
+    参照回数の多い順にdocsを取得してキャッシュを温める。
+    is_busyがTrueの間（実際のtool呼び出し等の描画中）は次の取得を始めずに待つ。
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[str]],
+        is_busy: Callable[[], bool],
+        idle_poll: float = SOFTREEF_WARMUP_IDLE_POLL,
+    ):
+        self.fetch = fetch
+        self.is_busy = is_busy
+        self.idle_poll = idle_poll
+        self._task: asyncio.Task | None = None
+        self.prefetched = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, uris: list[str]):
+        if self.running or not uris:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(uris))
+
+    async def _run(self, uris: list[str]):
+        logger.info(f"Warming up {len(uris)} documents")
+        for uri in uris:
+            while self.is_busy():
+                await asyncio.sleep(self.idle_poll)
+            try:
+                await self.fetch(uri)
+                self.prefetched += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f'Error "{str(e)}" was occurred during prefetching {uri}')
+        logger.info(f"Warm-up finished ({self.prefetched} prefetched, {self.failed} failed)")
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "prefetched": self.prefetched,
+            "failed": self.failed,
+        }
+
+
+access_frequency = AccessFrequency(Path(SOFTREEF_CACHE_DIR) / "access_frequency.json")
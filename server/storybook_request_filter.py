@@ -0,0 +1,69 @@
+import os
+import logging
+from fnmatch import fnmatch
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from playwright.async_api import Route
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("storybook_request_filter")
+
+
+def split_env_list(value: str | None) -> tuple[str, ...]:
+    if not value:
+        return ()
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+SOFTREEF_BLOCK_RESOURCES = os.getenv("SOFTREEF_BLOCK_RESOURCES", "1") == "1"
+SOFTREEF_BLOCKED_RESOURCE_TYPES = split_env_list(
+    os.getenv(
+        "SOFTREEF_BLOCKED_RESOURCE_TYPES",
+        "image,media,font,stylesheet,texttrack,eventsource,websocket,manifest",
+    )
+)
+SOFTREEF_BLOCKED_URL_PATTERNS = split_env_list(
+    os.getenv(
+        "SOFTREEF_BLOCKED_URL_PATTERNS",
+        "*google-analytics.com*,*googletagmanager.com*,*/__webpack_hmr*,*hot-update*",
+    )
+)
+SOFTREEF_ROUTE_ALLOWLIST = split_env_list(os.getenv("SOFTREEF_ROUTE_ALLOWLIST"))
+
+
+@dataclass
+class RequestFilter:
+    """
+    docsのテキスト抽出に不要なリクエストをPlaywrightのroutingで遮断する。
+    allowlistに一致するURLは種類に関わらず通す。
+    """
+
+    blocked_resource_types: tuple[str, ...] = SOFTREEF_BLOCKED_RESOURCE_TYPES
+    blocked_url_patterns: tuple[str, ...] = SOFTREEF_BLOCKED_URL_PATTERNS
+    allowlist: tuple[str, ...] = SOFTREEF_ROUTE_ALLOWLIST
+    blocked: int = field(default=0, compare=False)
+    allowed: int = field(default=0, compare=False)
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        if any(fnmatch(url, pattern) for pattern in self.allowlist):
+            return False
+        if resource_type in self.blocked_resource_types:
+            return True
+        return any(fnmatch(url, pattern) for pattern in self.blocked_url_patterns)
+
+    async def handle(self, route: "Route"):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            self.blocked += 1
+            await route.abort()
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+
+request_filter = RequestFilter()
@@ -11,6 +11,7 @@ from urllib3.exceptions import (
     ProxyError,
 )
 from dataclasses import dataclass
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,11 +24,39 @@ SOFTREEF_DESIGN_SYSTEM_STORYBOOK_BASE_URL = os.getenv(
 )
 
 
+def story_id_from_url(url: str) -> str | None:
+    path = parse_qs(urlsplit(url).query).get("path", [""])[0]
+    if not path.startswith("/docs/"):
+        return None
+    return path.removeprefix("/docs/")
+
+
+def iframe_url_from_url(url: str, story_id: str) -> str:
+    parts = urlsplit(url)
+    path = parts.path.rsplit("/", 1)[0] + "/iframe.html"
+    query = urlencode({"id": story_id, "viewMode": "docs"})
+    return urlunsplit((parts.scheme, parts.netloc, path, query, ""))
+
+
 @dataclass(frozen=True)
 class Resource:
     url: str
     name: str
     description: str
+    story_id: str | None = None
+
+    def __post_init__(self):
+        if self.story_id is None:
+            object.__setattr__(self, "story_id", story_id_from_url(self.url))
+
+    @property
+    def iframe_url(self) -> str | None:
+        """
+        managerのUIを経由せずにdocsだけを描画するpreviewのURL
+        """
+        if self.story_id is None:
+            return None
+        return iframe_url_from_url(self.url, self.story_id)
 
 
 overviews = [
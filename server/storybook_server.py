@@ -1,25 +1,39 @@
+import os
 import json
+import asyncio
 import logging
-from collections.abc import Sequence
+import sqlite3
+from collections.abc import Callable, Sequence
 from typing import Any
 import requests
 import httpx
 from dotenv import load_dotenv
 from pydantic import AnyUrl
+from mcp import types
 from mcp.server import Server
 from mcp.types import (
     Prompt,
     GetPromptResult,
     PromptMessage,
-    Resource,
+    ResourceTemplate,
     Tool,
     TextContent,
     ImageContent,
     EmbeddedResource,
 )
 
-from storybook_async_fetcher import markdown_format_text
+from storybook_async_fetcher import resource_markdown, shutdown_converter
+from browser_manager import browser_manager, page_pool
+from storybook_static_fetcher import static_storybook
+from markdown_cache import markdown_cache
+from disk_cache import SOFTREEF_DISK_CACHE, disk_cache
+from single_flight import SingleFlight
+from storybook_snapshot import SOFTREEF_SNAPSHOT_PATH, SnapshotBundle
+from render_scheduler import Priority, prioritized, render_job, render_scheduler
+from render_workers import render_worker_pool
+from storybook_prefetch import SOFTREEF_WARMUP, Prefetcher, access_frequency
 from storybook_resources import (
+    Resource as StorybookResource,
     uri_2_resource as sb_uri_2_resources,
     overviews as sb_overviews,
     components as sb_components,
@@ -37,263 +51,505 @@ from storybook_resources import (
 )
 from design_system_file_path_resources import uri_2_resource as ds_uri_2_resources
 from storybook_prompts import prompts
+from registry import Registry
+from resource_catalog import ResourceCatalog
+from markdown_sections import section_cache, select_sections
+from search_index import prepare, search_index
+from related_components import related_components
+from chunked_documents import MIN_CHUNK_BYTES, SOFTREEF_CHUNK_BYTES, chunked_documents
+from markdown_compaction import compaction_cache
+from http_transport import SOFTREEF_TRANSPORT, connection_limiter, serve_sse
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("softreef")
 
+SOFTREEF_BATCH_CONCURRENCY = int(os.getenv("SOFTREEF_BATCH_CONCURRENCY", "8"))
 
-async def get_storybook_resource(url: str):
+
+async def load_disk_cached_markdown(
+    uri: str, resource: StorybookResource
+) -> str | None:
+    """
+    ディスクのキャッシュが新しければそのまま返す。
+    古い場合はdocsのvalidatorが保存した時と同じで、変更が無いことを確認できれば返す。
+    """
     try:
-        markdown = await markdown_format_text(url)
-        return markdown
+        entry = await asyncio.to_thread(disk_cache.get, uri)
+    except sqlite3.Error as e:
+        logger.warning(f"{str(e)} was occurred during reading disk cache of {uri}")
+        return None
+    if entry is None:
+        return None
+    if entry.is_fresh():
+        return entry.markdown
+
+    try:
+        validator = await static_storybook.validator(resource)
+    except httpx.HTTPError as e:
+        logger.warning(
+            f"{str(e)} was occurred during revalidating {uri}. Serving stale markdown."
+        )
+        return entry.markdown
+
+    if validator is None or validator != entry.validator:
+        # backgroundで取得中のdocsが変更されていた場合、描画し直しはrevalidationとして扱う
+        priority, key = render_job.get()
+        if priority.is_background:
+            render_job.set((Priority.REVALIDATION, key))
+        return None
+    await asyncio.to_thread(disk_cache.touch, uri)
+    return entry.markdown
+
+
+async def render_storybook_resource(uri: str, resource: StorybookResource) -> str:
+    # 描画中にdeployされても古い内容を新しいETagで保存しないよう、描画前に取得しておく
+    validator = None
+    if SOFTREEF_DISK_CACHE:
+        try:
+            validator = await static_storybook.validator(resource)
+        except httpx.HTTPError as e:
+            logger.warning(f"{str(e)} was occurred during fetching validator of {uri}")
+
+    try:
+        markdown = await resource_markdown(resource)
     except httpx.HTTPError as e:
         raise RuntimeError(
-            f"{str(e)} was occurred during fetching storybook resource from the url: ({url})"
+            f"{str(e)} was occurred during fetching storybook resource from the url: ({resource.url})"
         )
 
+    if markdown and SOFTREEF_DISK_CACHE:
+        try:
+            await asyncio.to_thread(disk_cache.set, uri, markdown, validator)
+        except sqlite3.Error as e:
+            logger.warning(f"{str(e)} was occurred during writing disk cache of {uri}")
+    return markdown
+
+
+def search_document(uri: str, markdown: str = "") -> tuple[str, str]:
+    resource = sb_uri_2_resources[uri]
+    return resource.name, f"{resource.description}\n\n{markdown}"
+
+
+def index_document(uri: str, markdown: str):
+    search_index.update(uri, *search_document(uri, markdown))
+
+
+search_index_loaded = False
+# 読み込み中に届いた検索は、読み込みが終わるまで待たせる
+search_index_loads = SingleFlight()
+
+
+async def load_search_index():
+    """
+    初回の検索時に、snapshotかディスクキャッシュにある描画済みのdocsをindexに加える。
+    描画済みのmarkdownが無いdocsはcatalogの名前と説明だけで検索できるようにする。
+    読み込みに失敗した場合は、次の検索で読み込み直す。
+    """
+    if search_index_loaded:
+        return
+    await search_index_loads.do("search_index", populate_search_index)
+
+
+async def populate_search_index():
+    global search_index_loaded
+    if search_index_loaded:
+        return
+
+    def prepare_documents(uris: list[str]) -> dict:
+        documents = {}
+        if snapshot is not None:
+            documents = snapshot.documents()
+        elif SOFTREEF_DISK_CACHE:
+            try:
+                documents = disk_cache.documents()
+            except sqlite3.Error as e:
+                logger.warning(f"{str(e)} was occurred during reading disk cache")
+        return {
+            uri: prepare(*search_document(uri, documents.get(uri, "")))
+            for uri in uris
+        }
+
+    uris = [uri for uri in sb_uri_2_resources if uri not in search_index]
+    prepared = await asyncio.to_thread(prepare_documents, uris)
+    for uri, document in prepared.items():
+        # 準備中に描画されたdocsはそちらを優先する
+        if uri not in search_index:
+            search_index.add(uri, document)
+    search_index_loaded = True
+    logger.info(f"Indexed {len(prepared)} documents for search")
+
+
+async def load_storybook_resource(uri: str) -> str:
+    resource = sb_uri_2_resources[uri]
+    markdown = None
+    if SOFTREEF_DISK_CACHE:
+        markdown = await load_disk_cached_markdown(uri, resource)
+    if markdown is None:
+        markdown = await render_storybook_resource(uri, resource)
+
+    if markdown:
+        markdown_cache.set(uri, markdown)
+        index_document(uri, markdown)
+    return markdown
+
+
+storybook_fetches = SingleFlight()
+
+# snapshotが指定された場合は全てのdocsをsnapshotから返し、ブラウザやstorybookには一切アクセスしない
+snapshot = SnapshotBundle(SOFTREEF_SNAPSHOT_PATH) if SOFTREEF_SNAPSHOT_PATH else None
+
+
+async def fetch_storybook_resource(uri: str) -> str:
+    markdown = markdown_cache.get(uri)
+    if markdown is not None:
+        return markdown
+
+    if snapshot is not None:
+        markdown = snapshot.get(uri)
+        if markdown is None:
+            raise RuntimeError(f"{uri} is not included in the snapshot")
+        markdown_cache.set(uri, markdown)
+        index_document(uri, markdown)
+        return markdown
+
+    # 同じURIを同時に要求された場合は1回の描画を共有する
+    return await storybook_fetches.do(uri, lambda: load_storybook_resource(uri))
+
+
+background_tasks: set[asyncio.Task] = set()
+live_fetches = 0
+
+
+def record_access(uri: str):
+    if access_frequency.record(uri):
+        task = asyncio.create_task(
+            asyncio.to_thread(access_frequency.save, access_frequency.take())
+        )
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+
+async def get_storybook_resource(uri: str, priority: Priority = Priority.INTERACTIVE):
+    global live_fetches
+    if uri not in sb_uri_2_resources:
+        logger.error(f"URI: {uri} was not defined.")
+        raise RuntimeError(f"Not defined URI was given: {uri}")
+
+    record_access(uri)
+    live_fetches += 1
+    try:
+        with prioritized(priority, key=uri):
+            render_scheduler.promote(uri, priority)
+            return await fetch_storybook_resource(uri)
+    finally:
+        live_fetches -= 1
+
+
+async def prefetch_storybook_resource(uri: str) -> str:
+    with prioritized(Priority.PREFETCH, key=uri):
+        return await fetch_storybook_resource(uri)
+
+
+# warm-upはtool呼び出し等による取得が進行中の間は次の取得を始めない
+prefetcher = Prefetcher(prefetch_storybook_resource, lambda: live_fetches > 0)
+
 
 app = Server("softreef")
 
 
+async def on_initialized(notification: types.InitializedNotification):
+    """
+    clientとのhandshakeが完了した後、参照回数の多いdocsを裏で取得しておく。
+    """
+    if not SOFTREEF_WARMUP:
+        return
+    uris = await asyncio.to_thread(access_frequency.ordered, list(sb_uri_2_resources))
+    prefetcher.start(uris)
+
+
+app.notification_handlers[types.InitializedNotification] = on_initialized
+
+
+def prompt_result(text: str) -> GetPromptResult:
+    return GetPromptResult(
+        messages=[
+            PromptMessage(role="user", content=TextContent(type="text", text=text))
+        ]
+    )
+
+
+prompt_registry: Registry[Prompt] = Registry("Prompt not found: {name}")
+prompts_by_name = {prompt.name: prompt for prompt in prompts}
+
+
+@prompt_registry.register(prompts_by_name["softreef-design-system-overview"])
+async def prompt_softreef_design_system_overview(
+    arguments: dict[str, str],
+) -> GetPromptResult:
+    category = arguments.get("category")
+    uri = f"markdown://softreef/design-system/{category}"
+    response = await get_storybook_resource(uri=uri, priority=Priority.PROMPT)
+    return prompt_result(
+        f"Softreefのdesign-systemの{category}について以下の情報を参照して教えてください。"
+        f"\n\n{response}"
+    )
+
+
+@prompt_registry.register(prompts_by_name["softreef-design-system-component"])
+async def prompt_softreef_design_system_component(
+    arguments: dict[str, str],
+) -> GetPromptResult:
+    component = arguments.get("component")
+    uri = f"markdown://softreef/design-system/component/{component}"
+    response = await get_storybook_resource(uri=uri, priority=Priority.PROMPT)
+    return prompt_result(
+        f"Softreefのdesign-systemの{component}コンポーネントについて以下の情報を参照して教えてください。"
+        f"\n\n{response}"
+    )
+
+
+@prompt_registry.register(prompts_by_name["softreef-design-system-basic-element"])
+async def prompt_softreef_design_system_basic_element(
+    arguments: dict[str, str],
+) -> GetPromptResult:
+    element = arguments.get("element")
+    uri = f"markdown://softreef/design-system/basic-element/{element}"
+    response = await get_storybook_resource(uri=uri, priority=Priority.PROMPT)
+    return prompt_result(
+        f"Softreefのdesign-systemの基本要素の1つである{element}について以下の情報を参照して教えてください。"
+        f"\n\n{response}"
+    )
+
+
+@prompt_registry.register(prompts_by_name["softreef-design-system-design-pattern"])
+async def prompt_softreef_design_system_design_pattern(
+    arguments: dict[str, str],
+) -> GetPromptResult:
+    pattern = arguments.get("pattern")
+    uri = f"markdown://softreef/design-system/design-pattern/{pattern}"
+    response = await get_storybook_resource(uri=uri, priority=Priority.PROMPT)
+    return prompt_result(
+        f"Softreefのdesign-systemの{pattern} design-patternについて以下の情報を参照して教えてください。"
+        f"\n\n{response}"
+    )
+
+
 @app.list_prompts()
 async def list_prompts() -> list[Prompt]:
-    return prompts
+    return prompt_registry.definitions
 
 
 @app.get_prompt()
 async def get_prompt(
     name: str, arguments: dict[str, str] | None = None
 ) -> GetPromptResult:
-    if name == "softreef-design-system-overview":
-        category = arguments.get("category")
-        uri = f"markdown://softreef/design-system/{category}"
-        response = await get_storybook_resource(url=sb_uri_2_resources[uri].url)
-        return GetPromptResult(
-            messages=[
-                PromptMessage(
-                    role="user",
-                    content=TextContent(
-                        type="text",
-                        text=(
-                            f"Softreefのdesign-systemの{category}について以下の情報を参照して教えてください。"
-                            f"\n\n{response}"
-                        ),
-                    ),
-                )
-            ]
-        )
-    elif name == "softreef-design-system-component":
-        component = arguments.get("component")
-        uri = f"markdown://softreef/design-system/component/{component}"
-        response = await get_storybook_resource(url=sb_uri_2_resources[uri].url)
-        return GetPromptResult(
-            messages=[
-                PromptMessage(
-                    role="user",
-                    content=TextContent(
-                        type="text",
-                        text=(
-                            f"Softreefのdesign-systemの{component}コンポーネントについて以下の情報を参照して教えてください。"
-                            f"\n\n{response}"
-                        ),
-                    ),
-                )
-            ]
-        )
-    elif name == "softreef-design-system-basic-element":
-        element = arguments.get("element")
-        uri = f"markdown://softreef/design-system/basic-element/{element}"
-        response = await get_storybook_resource(url=sb_uri_2_resources[uri].url)
-        return GetPromptResult(
-            messages=[
-                PromptMessage(
-                    role="user",
-                    content=TextContent(
-                        type="text",
-                        text=(
-                            f"Softreefのdesign-systemの基本要素の1つである{element}について以下の情報を参照して教えてください。"
-                            f"\n\n{response}"
-                        )
-                    )
-                )
-            ]
-        )
-    elif name == "softreef-design-system-design-pattern":
-        pattern = arguments.get("pattern")
-        uri = f"markdown://softreef/design-system/design-pattern/{pattern}"
-        response = await get_storybook_resource(url=sb_uri_2_resources[uri].url)
-        return GetPromptResult(
-            messages=[
-                PromptMessage(
-                    role="user",
-                    content=TextContent(
-                        type="text",
-                        text=(
-                            f"Softreefのdesign-systemの{pattern} design-patternについて以下の情報を参照して教えてください。"
-                            f"\n\n{response}"
-                        ),
-                    ),
-                )
-            ]
-        )
-    else:
-        raise ValueError(f"Prompt not found: {name}")
+    async with connection_limiter.request():
+        return await prompt_registry.call(name, arguments)
 
 
-@app.list_resources()
-async def list_resources() -> list[Resource]:
-    return [
-        *[
-            Resource(
-                uri=key,
-                name=value.name,
-                description=value.description,
-                mimeType="text/markdown",
-            )
-            for key, value in sb_uri_2_resources.items()
-        ],
-        *[
-            Resource(
-                uri=key,
-                name=value.name,
-                description=value.description,
-                mimeType="text/plain",
-            )
-            for key, value in ds_uri_2_resources.items()
-        ],
-    ]
+resource_catalog = ResourceCatalog(
+    [(sb_uri_2_resources, "text/markdown"), (ds_uri_2_resources, "text/plain")]
+)
+
+resource_templates = [
+    ResourceTemplate(
+        uriTemplate="markdown://softreef/design-system/{category}",
+        name="Softreef design-system overview",
+        description="Softreefのdesign-systemの概要。categoryは"
+        + ", ".join(overview[0] for overview in sb_overviews),
+        mimeType="text/markdown",
+    ),
+    ResourceTemplate(
+        uriTemplate="markdown://softreef/design-system/component/{component}",
+        name="Softreef component",
+        description="Softreefのdesign-systemが提供しているコンポーネントのドキュメント",
+        mimeType="text/markdown",
+    ),
+    ResourceTemplate(
+        uriTemplate="markdown://softreef/design-system/basic-element/{element}",
+        name="Softreef basic element",
+        description="Softreefのdesign-systemが提供する基本要素のドキュメント",
+        mimeType="text/markdown",
+    ),
+    ResourceTemplate(
+        uriTemplate="markdown://softreef/design-system/design-pattern/{pattern}",
+        name="Softreef design pattern",
+        description="Softreefのdesign-systemが提供するデザインパターンのドキュメント",
+        mimeType="text/markdown",
+    ),
+    ResourceTemplate(
+        uriTemplate="filepath://softreef/design-system/component/{component}",
+        name="Path to Softreef component file",
+        description="Softreefのdesign-systemが提供するコンポーネントの実装ファイルパス",
+        mimeType="text/plain",
+    ),
+    ResourceTemplate(
+        uriTemplate="filepath://softreef/design-system/design-pattern/{pattern}",
+        name="Path to Softreef design-pattern file",
+        description="Softreefのdesign-systemが提供するデザインパターンの実装ファイルパス",
+        mimeType="text/plain",
+    ),
+]
+
+
+async def list_resources_page(request: types.ListResourcesRequest) -> types.ServerResult:
+    cursor = request.params.cursor if request.params else None
+    resources, next_cursor = resource_catalog.page(cursor)
+    return types.ServerResult(
+        types.ListResourcesResult(resources=resources, nextCursor=next_cursor)
+    )
+
+
+app.request_handlers[types.ListResourcesRequest] = list_resources_page
+
+
+@app.list_resource_templates()
+async def list_resource_templates() -> list[ResourceTemplate]:
+    return resource_templates
 
 
 @app.read_resource()
 async def read_resource(uri: AnyUrl) -> str:
     uri = str(uri)
     if uri in sb_uri_2_resources:
-        return await get_storybook_resource(url=sb_uri_2_resources[uri].url)
+        async with connection_limiter.request():
+            return await get_storybook_resource(uri=uri)
     elif uri in ds_uri_2_resources:
-        return await ds_uri_2_resources[uri].path
+        return ds_uri_2_resources[uri].path
     else:
         logger.error(f"URI: {uri} was not defined.")
         raise RuntimeError(f"Not defined URI was given: {uri}")
 
 
-@app.list_tools()
-async def list_tools() -> list[Tool]:
-    return [
-        Tool(
-            name="get_softreef_overview_description",
-            description="Softreefのdesign-systemの概要に関する情報を取得する",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "category": {
-                        "type": "string",
-                        "enum": [overview[0] for overview in sb_overviews],
-                        "description": "概要の種類",
-                    }
-                },
-                "required": ["category"],
-            },
-        ),
-        Tool(
-            name="get_available_softreef_component_description_list",
-            description="Softreefのdesign-systemが提供しているコンポーネントの一覧を取得する",
-            inputSchema={"type": "object", "properties": {}},
-        ),
-        Tool(
-            name="get_softreef_component_description",
-            description="Softreefのdesign-systemが提供しているコンポーネントに関する情報を取得する",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "component": {
-                        "type": "string",
-                        "enum": [component[0] for component in [
-                            *sb_components,
-                            *sb_form_components,
-                            *sb_checkbox_components,
-                            *sb_dialog_components,
-                            *sb_dropdownmenu_components,
-                            *sb_card_components,
-                            *sb_dropzone_components,
-                            *sb_paging_components,
-                            *sb_toggle_components,
-                            *sb_layout_components]],
-                        "description": "コンポーネント名",
-                    },
-                },
-                "required": ["component"],
-            },
-        ),
-        Tool(
-            name="get_available_softreef_basic_element_description_list",
-            description="Softreefのdesign-systemが提供する基本要素の一覧を取得する",
-            inputSchema={"type": "object", "properties": {}},
-        ),
-        Tool(
-            name="get_softreef_basic_element_description",
-            description="Softreefのdesign-systemが提供する基本要素に関する情報を取得する",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "element": {
-                        "type": "string",
-                        "enum": [element[0] for element in sb_basic_elements],
-                        "description": "基本要素名",
-                    },
-                },
-                "required": ["element"]
-            },
-        ),
-        Tool(
-            name="get_available_softreef_design_pattern_description_list",
-            description="Softreefのdesign-systemが提供するデザインパターンの一覧を取得する",
-            inputSchema={"type": "object", "properties": {}},
-        ),
-        Tool(
-            name="get_softreef_design_pattern_description",
-            description="Softreefのdesign-systemが提供するデザインパターンに関する情報を取得する",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "pattern": {
-                        "type": "string",
-                        "enum": [pattern[0] for pattern in sb_design_patterns],
-                        "description": "デザインパターン名",
-                    },
-                },
-                "required": ["pattern"],
-            },
-        ),
-        Tool(
-            name="get_softreef_component_file_path",
-            description="Softreefのdesign-systemが提供するコンポーネントの実装ファイルの絶対パスを取得する",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "component": {
-                        "type": "string",
-                        "enum": [component[0] for component in [
-                            *sb_components,
-                            *sb_form_components,
-                            *sb_checkbox_components,
-                            *sb_dialog_components,
-                            *sb_dropdownmenu_components,
-                            *sb_card_components,
-                            *sb_dropzone_components,
-                            *sb_paging_components,
-                            *sb_toggle_components,
-                            *sb_layout_components]],
-                        "description": "コンポーネント名",
-                    },
-                },
-                "required": ["component"],
-            },
-        ),
+# toolのenumはimport時に1度だけ作り、Toolの定義と一覧のtoolで共有する
+overview_names = [overview[0] for overview in sb_overviews]
+component_names = [
+    component[0]
+    for component in [
+        *sb_components,
+        *sb_form_components,
+        *sb_checkbox_components,
+        *sb_dialog_components,
+        *sb_dropdownmenu_components,
+        *sb_card_components,
+        *sb_dropzone_components,
+        *sb_paging_components,
+        *sb_toggle_components,
+        *sb_layout_components,
     ]
+]
+basic_element_names = [element[0] for element in sb_basic_elements]
+design_pattern_names = [pattern[0] for pattern in sb_design_patterns]
+component_list_text = str(component_names)
+basic_element_list_text = str(basic_element_names)
+design_pattern_list_text = str(design_pattern_names)
+
+tool_registry: Registry[Tool] = Registry("Unknown tool: {name}")
+
+
+def text_content(text: str) -> Sequence[TextContent]:
+    return [TextContent(type="text", text=text)]
+
+
+sections_property = {
+    "type": "array",
+    "items": {"type": "string"},
+    "description": (
+        "取得する見出しの一覧。見出しの名前（例: `Props`）か`/`で区切った見出しのpath"
+        "（例: `Button/Props`）を指定する。省略した場合は全体を返す"
+    ),
+}
+
+
+def document_text(uri: str, markdown: str, arguments: dict) -> str:
+    sections = arguments.get("sections")
+    if not sections:
+        return markdown
+    if not isinstance(sections, list):
+        raise ValueError("Argument 'sections' must be a list")
+    return select_sections(markdown, section_cache.get(uri, markdown), sections)
+
 
+chunk_properties = {
+    "chunk_size": {
+        "type": "integer",
+        "minimum": MIN_CHUNK_BYTES,
+        "description": f"1回に返す最大のbytes数（既定は{SOFTREEF_CHUNK_BYTES}）。超える場合は続きを取得するためのcursorを返す",
+    },
+    "cursor": {
+        "type": "string",
+        "description": "前回の応答で返されたcursor。指定した場合は続きのchunkを返す",
+    },
+}
 
+
+max_tokens_property = {
+    "type": "integer",
+    "minimum": 1,
+    "description": (
+        "返す内容のtoken数の上限。超える場合はstoryのsource、propsの表、例の順に省略し、"
+        "省略した内容を末尾に記載する"
+    ),
+}
+
+
+def max_tokens_of(arguments: dict) -> int | None:
+    max_tokens = arguments.get("max_tokens")
+    if max_tokens is None:
+        return None
+    if not isinstance(max_tokens, int) or max_tokens < 1:
+        raise ValueError("Argument 'max_tokens' must be a positive integer")
+    return max_tokens
+
+
+def compacted_text(key: str, text: str, max_tokens: int | None) -> str:
+    if max_tokens is None:
+        return text
+    return compaction_cache.compact(key, text, max_tokens).annotated
+
+
+def document_contents(uri: str, markdown: str, arguments: dict) -> Sequence[TextContent]:
+    sections = arguments.get("sections")
+    key = f"{uri}#{json.dumps(sections, ensure_ascii=False)}" if sections else uri
+    max_tokens = max_tokens_of(arguments)
+    text = compacted_text(key, document_text(uri, markdown, arguments), max_tokens)
+    size = int(arguments.get("chunk_size") or SOFTREEF_CHUNK_BYTES)
+    cursor = arguments.get("cursor")
+    # UTF-8では1文字が最大4bytesのため、文字数の4倍が収まれば全体をそのまま返す
+    if not cursor and (size <= 0 or len(text) * 4 <= size):
+        return text_content(text)
+
+    if max_tokens is not None:
+        key = f"{key}@{max_tokens}"
+    chunk = chunked_documents.chunk(key, text, size, cursor)
+    contents = [TextContent(type="text", text=chunk.text)]
+    if chunk.next_cursor is not None:
+        contents.append(
+            TextContent(
+                type="text",
+                text=(
+                    f"({chunk.end}/{chunk.total} bytes) 続きはcursorに"
+                    f"`{chunk.next_cursor}`を指定して取得してください"
+                ),
+            )
+        )
+    return contents
+
+
+@tool_registry.register(
+    Tool(
+        name="run_aggregation",
+        description="集計を実行する（例）",
+        inputSchema={
+            "type": "object",
+            "properties": {"aggregation": {"type": "object"}},
+            "required": ["aggregation"],
+        },
+    ),
+    listed=False,
+)
 async def call_run_aggregation(arguments: Any) -> Sequence[TextContent]:
     if not isinstance(arguments, dict) or "aggregation" not in arguments:
         raise ValueError("Required argument 'aggregation' not found")
@@ -309,6 +565,26 @@ async def call_run_aggregation(arguments: Any) -> Sequence[TextContent]:
         raise RuntimeError(f"{str(e)} was occurred during calling run aggregation")
 
 
+@tool_registry.register(
+    Tool(
+        name="get_softreef_overview_description",
+        description="Softreefのdesign-systemの概要に関する情報を取得する",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "category": {
+                    "type": "string",
+                    "enum": overview_names,
+                    "description": "概要の種類",
+                },
+                "sections": sections_property,
+                "max_tokens": max_tokens_property,
+                **chunk_properties,
+            },
+            "required": ["category"],
+        },
+    )
+)
 async def call_get_softreef_overview_description(
     arguments: Any,
 ) -> Sequence[TextContent]:
@@ -316,28 +592,43 @@ async def call_get_softreef_overview_description(
         raise ValueError("Required argument 'category' not found")
 
     uri = f"markdown://softreef/design-system/{arguments.get("category")}"
-    response = await get_storybook_resource(url=sb_uri_2_resources.get(uri).url)
-    return [TextContent(type="text", text=response)]
-
-
-async def call_get_available_softreef_component_description_list() -> (
-    Sequence[TextContent]
-):
-    tools = await list_tools()
-    get_softreef_component_description_tool = None
-    for tool in tools:
-        if tool.name == "get_softreef_component_description":
-            get_softreef_component_description_tool = tool
-
-    components = (
-        get_softreef_component_description_tool.inputSchema.get("properties")
-        .get("component")
-        .get("enum")
+    response = await get_storybook_resource(uri=uri)
+    return document_contents(uri, response, arguments)
+
+
+@tool_registry.register(
+    Tool(
+        name="get_available_softreef_component_description_list",
+        description="Softreefのdesign-systemが提供しているコンポーネントの一覧を取得する",
+        inputSchema={"type": "object", "properties": {}},
     )
-    response = f"{str(components)}"
-    return [TextContent(type="text", text=response)]
+)
+async def call_get_available_softreef_component_description_list(
+    arguments: Any,
+) -> Sequence[TextContent]:
+    return text_content(component_list_text)
 
 
+@tool_registry.register(
+    Tool(
+        name="get_softreef_component_description",
+        description="Softreefのdesign-systemが提供しているコンポーネントに関する情報を取得する",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "component": {
+                    "type": "string",
+                    "enum": component_names,
+                    "description": "コンポーネント名",
+                },
+                "sections": sections_property,
+                "max_tokens": max_tokens_property,
+                **chunk_properties,
+            },
+            "required": ["component"],
+        },
+    )
+)
 async def call_get_softreef_component_description(
     arguments: Any,
 ) -> Sequence[TextContent]:
@@ -345,51 +636,87 @@ async def call_get_softreef_component_description(
         raise ValueError("Required argument 'component' not found")
 
     uri = f"markdown://softreef/design-system/component/{arguments.get("component")}"
-    response = await get_storybook_resource(url=sb_uri_2_resources.get(uri).url)
-    return [TextContent(type="text", text=response)]
+    response = await get_storybook_resource(uri=uri)
+    return document_contents(uri, response, arguments)
 
 
-async def call_get_available_softreef_basic_element_description_list() -> Sequence[TextContent]:
-    tools = await list_tools()
-    get_softreef_basic_element_description_tool = None
-    for tool in tools:
-        if tool.name == "get_softreef_basic_element_description":
-            get_softreef_basic_element_description_tool = tool
-
-    elements = (
-        get_softreef_basic_element_description_tool.inputSchema.get("properties")
-        .get("element")
-        .get("enum")
+@tool_registry.register(
+    Tool(
+        name="get_available_softreef_basic_element_description_list",
+        description="Softreefのdesign-systemが提供する基本要素の一覧を取得する",
+        inputSchema={"type": "object", "properties": {}},
     )
-    response = f"{str(elements)}"
-    return [TextContent(type="text", text=response)]
+)
+async def call_get_available_softreef_basic_element_description_list(
+    arguments: Any,
+) -> Sequence[TextContent]:
+    return text_content(basic_element_list_text)
 
-async def call_get_softreef_basic_element_description(arguments) -> Sequence[TextContent]:
+
+@tool_registry.register(
+    Tool(
+        name="get_softreef_basic_element_description",
+        description="Softreefのdesign-systemが提供する基本要素に関する情報を取得する",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "element": {
+                    "type": "string",
+                    "enum": basic_element_names,
+                    "description": "基本要素名",
+                },
+                "sections": sections_property,
+                "max_tokens": max_tokens_property,
+                **chunk_properties,
+            },
+            "required": ["element"],
+        },
+    )
+)
+async def call_get_softreef_basic_element_description(
+    arguments: Any,
+) -> Sequence[TextContent]:
     if not isinstance(arguments, dict) or not "element" in arguments:
         raise ValueError("Required argument 'element' not found")
 
     uri = f"markdown://softreef/design-system/basic-element/{arguments.get("element")}"
-    response = await get_storybook_resource(url=sb_uri_2_resources.get(uri).url)
-    return [TextContent(type="text", text=response)]
-
-async def call_get_available_softreef_design_pattern_description_list() -> (
-    Sequence[TextContent]
-):
-    tools = await list_tools()
-    get_softreef_design_pattern_description_tool = None
-    for tool in tools:
-        if tool.name == "get_softreef_design_pattern_description":
-            get_softreef_design_pattern_description_tool = tool
-
-    patterns = (
-        get_softreef_design_pattern_description_tool.inputSchema.get("properties")
-        .get("pattern")
-        .get("enum")
+    response = await get_storybook_resource(uri=uri)
+    return document_contents(uri, response, arguments)
+
+
+@tool_registry.register(
+    Tool(
+        name="get_available_softreef_design_pattern_description_list",
+        description="Softreefのdesign-systemが提供するデザインパターンの一覧を取得する",
+        inputSchema={"type": "object", "properties": {}},
     )
-    response = f"{str(patterns)}"
-    return [TextContent(type="text", text=response)]
+)
+async def call_get_available_softreef_design_pattern_description_list(
+    arguments: Any,
+) -> Sequence[TextContent]:
+    return text_content(design_pattern_list_text)
 
 
+@tool_registry.register(
+    Tool(
+        name="get_softreef_design_pattern_description",
+        description="Softreefのdesign-systemが提供するデザインパターンに関する情報を取得する",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "pattern": {
+                    "type": "string",
+                    "enum": design_pattern_names,
+                    "description": "デザインパターン名",
+                },
+                "sections": sections_property,
+                "max_tokens": max_tokens_property,
+                **chunk_properties,
+            },
+            "required": ["pattern"],
+        },
+    )
+)
 async def call_get_softreef_design_pattern_description(
     arguments: Any,
 ) -> Sequence[TextContent]:
@@ -397,10 +724,266 @@ async def call_get_softreef_design_pattern_description(
         raise ValueError("Required argument 'pattern' not found")
 
     uri = f"markdown://softreef/design-system/design-pattern/{arguments.get("pattern")}"
-    response = await get_storybook_resource(url=sb_uri_2_resources.get(uri).url)
-    return [TextContent(type="text", text=response)]
+    response = await get_storybook_resource(uri=uri)
+    return document_contents(uri, response, arguments)
+
 
+# batchのtoolで指定できる項目の種類。(引数名, 見出し, URIのprefix)
+batch_item_kinds = [
+    ("components", "component", "markdown://softreef/design-system/component/"),
+    ("basic_elements", "basic-element", "markdown://softreef/design-system/basic-element/"),
+    ("patterns", "design-pattern", "markdown://softreef/design-system/design-pattern/"),
+]
 
+
+async def fetch_batch_item(
+    semaphore: asyncio.Semaphore,
+    kind: str,
+    name: str,
+    uri: str,
+    max_tokens: int | None = None,
+) -> TextContent:
+    async with semaphore:
+        try:
+            markdown = await get_storybook_resource(uri=uri)
+        except Exception as e:
+            logger.warning(f'Error "{str(e)}" was occurred during fetching {uri}')
+            return TextContent(type="text", text=f"## {kind}: {name}\n\nError: {str(e)}")
+    markdown = compacted_text(uri, markdown, max_tokens)
+    return TextContent(type="text", text=f"## {kind}: {name}\n\n{markdown}")
+
+
+@tool_registry.register(
+    Tool(
+        name="get_softreef_component_descriptions",
+        description=(
+            "Softreefのdesign-systemが提供するコンポーネント・基本要素・デザインパターンの情報をまとめて取得する。"
+            "取得できなかった項目はその項目だけエラーとして返す"
+        ),
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "components": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": component_names},
+                    "description": "コンポーネント名の一覧",
+                },
+                "basic_elements": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": basic_element_names},
+                    "description": "基本要素名の一覧",
+                },
+                "patterns": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": design_pattern_names},
+                    "description": "デザインパターン名の一覧",
+                },
+                "max_tokens": {
+                    **max_tokens_property,
+                    "description": (
+                        "返す内容全体のtoken数の上限。各項目に均等に割り当て、"
+                        "超える項目はstoryのsource、propsの表、例の順に省略する"
+                    ),
+                },
+            },
+        },
+    )
+)
+async def call_get_softreef_component_descriptions(
+    arguments: Any,
+) -> Sequence[TextContent]:
+    if not isinstance(arguments, dict) or not any(
+        arguments.get(argument) for argument, _, _ in batch_item_kinds
+    ):
+        raise ValueError(
+            "At least one of 'components', 'basic_elements' or 'patterns' is required"
+        )
+
+    items = []
+    for argument, kind, prefix in batch_item_kinds:
+        names = arguments.get(argument) or []
+        if not isinstance(names, list):
+            raise ValueError(f"Argument '{argument}' must be a list")
+        # 同じ項目が重複して指定されても1度だけ返す
+        items += [(kind, name, f"{prefix}{name}") for name in dict.fromkeys(names)]
+
+    max_tokens = max_tokens_of(arguments)
+    if max_tokens is not None:
+        max_tokens = max(max_tokens // len(items), 1)
+
+    # 各項目の取得はキャッシュ・single-flight・描画の優先度付けを共有し、同時に進める
+    semaphore = asyncio.Semaphore(SOFTREEF_BATCH_CONCURRENCY)
+    return await asyncio.gather(
+        *[
+            fetch_batch_item(semaphore, kind, name, uri, max_tokens)
+            for kind, name, uri in items
+        ]
+    )
+
+
+@tool_registry.register(
+    Tool(
+        name="search_softreef_docs",
+        description=(
+            "Softreefのdesign-systemのドキュメントを全文検索し、関連度の高い順にURIと抜粋を返す。"
+            "まだ取得されていないドキュメントは名前と説明だけが検索対象になる"
+        ),
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "検索語",
+                },
+                "limit": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": 50,
+                    "description": "返す件数（既定は10）",
+                },
+            },
+            "required": ["query"],
+        },
+    )
+)
+async def call_search_softreef_docs(arguments: Any) -> Sequence[TextContent]:
+    if not isinstance(arguments, dict) or not arguments.get("query"):
+        raise ValueError("Required argument 'query' not found")
+
+    query = arguments.get("query")
+    limit = min(max(int(arguments.get("limit") or 10), 1), 50)
+    await load_search_index()
+
+    hits = search_index.search(query, limit)
+    if not hits:
+        return text_content(f"No documents matched: {query}")
+    lines = []
+    for rank, (uri, score) in enumerate(hits, start=1):
+        lines.append(
+            f"{rank}. **{search_index.document(uri).title}** (`{uri}`, score: {score:.2f})"
+        )
+        lines.append(f"   {search_index.snippet(uri, query)}")
+    return text_content("\n".join(lines))
+
+
+related_builds = SingleFlight()
+
+
+async def load_related_components():
+    """
+    検索indexと同じcorpus（描画済みのdocs、無ければ名前と説明）から類似度の行列を作る。
+    indexが更新されていなければ作り直さない。
+    """
+    await load_search_index()
+    version = search_index.updates
+    if related_components.is_current(version):
+        return
+
+    prefixes = tuple(prefix for _, _, prefix in batch_item_kinds)
+    documents = {
+        uri: f"{document.title}\n{document.text}"
+        for uri, document in search_index.documents().items()
+        if uri.startswith(prefixes)
+    }
+    await related_builds.do(
+        str(version),
+        lambda: asyncio.to_thread(related_components.build, documents, version),
+    )
+
+
+related_item_kinds = [
+    ("component", "markdown://softreef/design-system/component/"),
+    ("element", "markdown://softreef/design-system/basic-element/"),
+    ("pattern", "markdown://softreef/design-system/design-pattern/"),
+]
+
+
+@tool_registry.register(
+    Tool(
+        name="get_related_softreef_components",
+        description=(
+            "指定したコンポーネント・基本要素・デザインパターンと説明やドキュメントの内容が似ている"
+            "コンポーネント・基本要素・デザインパターンを類似度の高い順に返す。"
+            "component, element, patternのいずれか1つを指定する"
+        ),
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "component": {
+                    "type": "string",
+                    "enum": component_names,
+                    "description": "コンポーネント名",
+                },
+                "element": {
+                    "type": "string",
+                    "enum": basic_element_names,
+                    "description": "基本要素名",
+                },
+                "pattern": {
+                    "type": "string",
+                    "enum": design_pattern_names,
+                    "description": "デザインパターン名",
+                },
+                "limit": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": 20,
+                    "description": "返す件数（既定は5）",
+                },
+            },
+        },
+    )
+)
+async def call_get_related_softreef_components(
+    arguments: Any,
+) -> Sequence[TextContent]:
+    if not isinstance(arguments, dict):
+        raise ValueError("Required argument 'component' not found")
+    given = [
+        (argument, prefix)
+        for argument, prefix in related_item_kinds
+        if arguments.get(argument)
+    ]
+    if len(given) != 1:
+        raise ValueError(
+            "Exactly one of 'component', 'element' or 'pattern' is required"
+        )
+
+    argument, prefix = given[0]
+    uri = f"{prefix}{arguments.get(argument)}"
+    if uri not in sb_uri_2_resources:
+        raise ValueError(f"Unknown {argument}: {arguments.get(argument)}")
+    limit = min(max(int(arguments.get("limit") or 5), 1), 20)
+    await load_related_components()
+
+    lines = []
+    for rank, (related_uri, similarity) in enumerate(
+        related_components.related(uri, limit), start=1
+    ):
+        title = search_index.document(related_uri).title
+        lines.append(
+            f"{rank}. **{title}** (`{related_uri}`, similarity: {similarity:.3f})"
+        )
+    return text_content("\n".join(lines))
+
+
+@tool_registry.register(
+    Tool(
+        name="get_softreef_component_file_path",
+        description="Softreefのdesign-systemが提供するコンポーネントの実装ファイルの絶対パスを取得する",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "component": {
+                    "type": "string",
+                    "enum": component_names,
+                    "description": "コンポーネント名",
+                },
+            },
+            "required": ["component"],
+        },
+    )
+)
 async def call_get_softreef_component_file_path(
     arguments: Any,
 ) -> Sequence[TextContent]:
@@ -409,40 +992,129 @@ async def call_get_softreef_component_file_path(
 
     uri = f"filepath://softreef/design-system/component/{arguments.get("component")}"
     response = ds_uri_2_resources.get(uri).path
-    return [TextContent(type="text", text=response)]
+    return text_content(response)
+
+
+async def manage_disk_cache(operation: Callable[..., Any], *args) -> Any:
+    """
+    ディスクキャッシュを使わない設定やsnapshotから返す場合はNoneを返し、ファイルを作らない。
+    読み書きに失敗した場合はtool全体を失敗させず、エラーの内容を返す。
+    """
+    if not SOFTREEF_DISK_CACHE or snapshot is not None:
+        return None
+    try:
+        return await asyncio.to_thread(operation, *args)
+    except sqlite3.Error as e:
+        logger.warning(f"{str(e)} was occurred during managing disk cache")
+        return {"error": str(e)}
+
+
+@tool_registry.register(
+    Tool(
+        name="manage_softreef_cache",
+        description="取得済みのdesign-systemの情報のキャッシュを確認・破棄する（管理用）",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "action": {
+                    "type": "string",
+                    "enum": ["stats", "list", "invalidate", "clear"],
+                    "description": "stats: 統計情報、list: キャッシュ済みのURI一覧、invalidate: 指定したURIを破棄、clear: 全て破棄",
+                },
+                "uri": {
+                    "type": "string",
+                    "description": "invalidateの対象のURI",
+                },
+            },
+            "required": ["action"],
+        },
+    )
+)
+async def call_manage_softreef_cache(arguments: Any) -> Sequence[TextContent]:
+    if not isinstance(arguments, dict) or not "action" in arguments:
+        raise ValueError("Required argument 'action' not found")
+
+    action = arguments.get("action")
+    if action == "stats":
+        response = {
+            "cache": markdown_cache.stats(),
+            "disk_cache": await manage_disk_cache(disk_cache.stats),
+            "page_pool": page_pool.stats(),
+            "single_flight": storybook_fetches.stats(),
+            "prefetch": prefetcher.stats(),
+            "render_scheduler": render_scheduler.stats(),
+            "render_workers": render_worker_pool.stats(),
+            "sections": section_cache.stats(),
+            "search_index": search_index.stats(),
+            "related_components": related_components.stats(),
+            "chunks": chunked_documents.stats(),
+            "compaction": compaction_cache.stats(),
+            "connections": connection_limiter.stats(),
+            "snapshot": (
+                {"path": snapshot.path, "entries": len(snapshot)}
+                if snapshot is not None
+                else None
+            ),
+        }
+    elif action == "list":
+        response = markdown_cache.entries()
+    elif action == "invalidate":
+        if not "uri" in arguments:
+            raise ValueError("Required argument 'uri' not found")
+        uri = arguments.get("uri")
+        response = {
+            "invalidated": markdown_cache.invalidate(uri),
+            "invalidated_on_disk": await manage_disk_cache(disk_cache.invalidate, uri),
+        }
+    elif action == "clear":
+        response = {
+            "cleared": markdown_cache.clear(),
+            "cleared_on_disk": await manage_disk_cache(disk_cache.clear),
+        }
+    else:
+        raise ValueError(f"Unknown action: {action}")
+    return [
+        TextContent(
+            type="text", text=json.dumps(response, indent=2, ensure_ascii=False)
+        )
+    ]
+
+
+@app.list_tools()
+async def list_tools() -> list[Tool]:
+    return tool_registry.definitions
 
 
 @app.call_tool()
 async def call_tool(
     name: str, arguments: Any
 ) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
-    if name == "run_aggregation":
-        return await call_run_aggregation(arguments)
-    elif name == "get_softreef_overview_description":
-        return await call_get_softreef_overview_description(arguments)
-    elif name == "get_available_softreef_component_description_list":
-        return await call_get_available_softreef_component_description_list()
-    elif name == "get_softreef_component_description":
-        return await call_get_softreef_component_description(arguments)
-    elif name == "get_available_softreef_basic_element_description_list":
-        return await call_get_available_softreef_basic_element_description_list()
-    elif name == "get_softreef_basic_element_description":
-        return await call_get_softreef_basic_element_description(arguments)
-    elif name == "get_available_softreef_design_pattern_description_list":
-        return await call_get_available_softreef_design_pattern_description_list()
-    elif name == "get_softreef_design_pattern_description":
-        return await call_get_softreef_design_pattern_description(arguments)
-    elif name == "get_softreef_component_file_path":
-        return await call_get_softreef_component_file_path(arguments)
-    else:
-        raise ValueError(f"Unknown tool: {name}")
+    async with connection_limiter.request():
+        return await tool_registry.call(name, arguments)
 
 
 async def main():
     from mcp.server.stdio import stdio_server
 
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(read_stream, write_stream, app.create_initialization_options())
+    if SOFTREEF_TRANSPORT not in ("stdio", "sse"):
+        raise ValueError(f"Unknown transport: {SOFTREEF_TRANSPORT}")
+
+    try:
+        if SOFTREEF_TRANSPORT == "sse":
+            await serve_sse(app)
+        else:
+            async with stdio_server() as (read_stream, write_stream):
+                await app.run(
+                    read_stream, write_stream, app.create_initialization_options()
+                )
+    finally:
+        await prefetcher.stop()
+        await asyncio.to_thread(access_frequency.save)
+        await static_storybook.close()
+        await render_worker_pool.close()
+        await page_pool.close()
+        await browser_manager.close()
+        shutdown_converter()
 
 
 if __name__ == "__main__":
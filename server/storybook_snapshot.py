@@ -0,0 +1,364 @@
+import os
+import mmap
+import json
+import zlib
+import time
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+import httpx
+from dotenv import load_dotenv
+
+from browser_manager import browser_manager, page_pool
+from render_workers import render_worker_pool
+from storybook_async_fetcher import resource_markdown, shutdown_converter
+from storybook_resources import uri_2_resource
+from storybook_static_fetcher import static_storybook
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("storybook_snapshot")
+
+SOFTREEF_SNAPSHOT_PATH = os.getenv("SOFTREEF_SNAPSHOT_PATH")
+
+# snapshotのファイル形式
+#
+#     MAGIC (8 bytes) | format version (uint16) | index length (uint32) | index (JSON) | blobs
+#
+# indexは各URIのmarkdownをzlibで圧縮したblobの位置を持ち、blobはindexの直後から順に並ぶ。
+MAGIC = b"SFSNAP\0\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHI")
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def write_snapshot(
+    path: str, documents: dict[str, str], metadata: dict | None = None
+):
+    entries = {}
+    blobs = []
+    offset = 0
+    for uri, markdown in sorted(documents.items()):
+        raw = markdown.encode("utf-8")
+        blob = zlib.compress(raw, level=9)
+        entries[uri] = {
+            "offset": offset,
+            "length": len(blob),
+            "size": len(raw),
+            "sha256": hashlib.sha256(raw).hexdigest(),
+        }
+        blobs.append(blob)
+        offset += len(blob)
+
+    index = json.dumps(
+        {"created_at": time.time(), **(metadata or {}), "entries": entries},
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+    # 書き込み途中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+    temporary = Path(f"{path}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(index)))
+        f.write(index)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(temporary, path)
+
+
+class SnapshotBundle:
+    """
+    snapshotをmemory-mapで開き、URIからmarkdownを引く。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot file")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format version: {version}")
+
+        index_end = HEADER.size + index_length
+        self.index = json.loads(self._mmap[HEADER.size : index_end])
+        self.entries: dict[str, dict] = self.index["entries"]
+        self._blob_start = index_end
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, uri: str) -> str | None:
+        entry = self.entries.get(uri)
+        if entry is None:
+            return None
+        start = self._blob_start + entry["offset"]
+        blob = self._mmap[start : start + entry["length"]]
+        return zlib.decompress(blob).decode("utf-8")
+
+    @property
+    def manifest(self) -> dict | None:
+        return self.index.get("manifest")
+
+    def documents(self) -> dict[str, str]:
+        return {uri: self.get(uri) for uri in self.entries}
+
+    def close(self):
+        self._mmap.close()
+
+
+async def render_documents(
+    uris: list[str], concurrency: int
+) -> tuple[dict[str, str], list[str]]:
+    semaphore = asyncio.Semaphore(concurrency)
+    documents: dict[str, str] = {}
+    failures: list[str] = []
+
+    async def render(uri: str):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                markdown = await resource_markdown(uri_2_resource[uri])
+            except Exception as e:
+                # 1件の失敗で他の描画結果を失わないよう、失敗したURIとして扱う
+                failures.append(uri)
+                logger.error(f'Error "{str(e)}" was occurred during rendering {uri}')
+                return
+            elapsed = time.perf_counter() - started
+        if markdown:
+            documents[uri] = markdown
+            logger.info(f"Rendered {uri} in {elapsed:.1f}s")
+        else:
+            failures.append(uri)
+            logger.error(f"No markdown was rendered for {uri}")
+
+    await asyncio.gather(*[render(uri) for uri in uris])
+    return documents, failures
+
+
+def fingerprint(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+async def build_manifest(uris: list[str]) -> dict:
+    """
+    deployされたstorybookの`index.json`から、URIごとのentryのfingerprintとbuild全体のhashを作る。
+    `index.json`のentryはdocsの本文を変更しても変わらないため、contentに`importPath`のソースのhashを持つ。
+    ソースを取得できない場合はpreviewの`iframe.html`のhashで代用する。
+    `index.json`に無いURIのfingerprintはNoneになる。
+    """
+    indexes: dict[str, dict] = {}
+    previews: dict[str, str | None] = {}
+    records: dict[str, tuple[str, dict | None]] = {}
+    for uri in uris:
+        resource = uri_2_resource[uri]
+        base_url = static_storybook.base_url(resource)
+        if base_url not in indexes:
+            indexes[base_url] = await static_storybook.index(base_url)
+        records[uri] = (base_url, indexes[base_url].get(resource.story_id))
+
+    if not any(indexes.values()):
+        raise SnapshotError("index.json of the deployed storybook was not found")
+
+    semaphore = asyncio.Semaphore(8)
+
+    async def content(base_url: str, entry: dict) -> str | None:
+        async with semaphore:
+            source = None
+            if entry.get("importPath"):
+                source = await static_storybook.source_hash(
+                    base_url, entry["importPath"]
+                )
+            if source is not None:
+                return source
+            if base_url not in previews:
+                previews[base_url] = await static_storybook.preview_hash(base_url)
+            return previews[base_url]
+
+    contents = await asyncio.gather(
+        *[
+            content(base_url, entry) if entry is not None else asyncio.sleep(0)
+            for base_url, entry in records.values()
+        ]
+    )
+
+    entries = {}
+    for (uri, (_, entry)), source in zip(records.items(), contents):
+        entries[uri] = {
+            "story_id": uri_2_resource[uri].story_id,
+            "fingerprint": fingerprint(entry) if entry is not None else None,
+            "content": source,
+        }
+    return {"build_hash": fingerprint([indexes, entries]), "entries": entries}
+
+
+async def close_renderers():
+    await static_storybook.close()
+    await render_worker_pool.close()
+    await page_pool.close()
+    await browser_manager.close()
+    shutdown_converter()
+
+
+async def bake(output: str, concurrency: int) -> list[str]:
+    """
+    storybook_resourcesの全てのURIを描画し、1つのsnapshotに書き出す。
+    描画できなかったURIを返す。
+    """
+    started = time.perf_counter()
+    try:
+        manifest = None
+        try:
+            manifest = await build_manifest(list(uri_2_resource))
+        except (SnapshotError, httpx.HTTPError) as e:
+            logger.warning(f"{str(e)}. Baking the snapshot without a manifest.")
+        documents, failures = await render_documents(
+            list(uri_2_resource), concurrency
+        )
+    finally:
+        await close_renderers()
+
+    write_snapshot(output, documents, {"manifest": manifest})
+    logger.info(
+        f"Baked {len(documents)} documents into {output} "
+        f"({os.path.getsize(output)} bytes) in {time.perf_counter() - started:.1f}s"
+    )
+    return failures
+
+
+@dataclass
+class RefreshReport:
+    build_changed: bool
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"build changed: {self.build_changed}, added: {len(self.added)}, "
+            f"changed: {len(self.changed)}, removed: {len(self.removed)}, "
+            f"unchanged: {len(self.unchanged)}, failed: {len(self.failed)}, "
+            f"elapsed: {self.elapsed_seconds:.1f}s"
+        )
+
+
+async def refresh(path: str, output: str, concurrency: int) -> RefreshReport:
+    """
+    snapshotに保存したmanifestと現在の`index.json`を比較し、追加・変更されたdocsだけを描画し直す。
+    catalogや`index.json`から消えたdocsはsnapshotから取り除く。
+    """
+    started = time.perf_counter()
+    bundle = SnapshotBundle(path)
+    old_manifest = bundle.manifest or {"build_hash": None, "entries": {}}
+    old_entries = old_manifest["entries"]
+
+    try:
+        manifest = await build_manifest(list(uri_2_resource))
+        report = RefreshReport(
+            build_changed=manifest["build_hash"] != old_manifest["build_hash"]
+        )
+
+        for uri, entry in manifest["entries"].items():
+            if entry["fingerprint"] is None:
+                if uri in bundle:
+                    report.removed.append(uri)
+            elif uri not in bundle:
+                report.added.append(uri)
+            elif uri not in old_entries or old_entries[uri] != entry:
+                report.changed.append(uri)
+            else:
+                report.unchanged.append(uri)
+        report.removed += [uri for uri in bundle.entries if uri not in uri_2_resource]
+
+        rendered, report.failed = await render_documents(
+            report.added + report.changed, concurrency
+        )
+    finally:
+        await close_renderers()
+
+    documents = {uri: bundle.get(uri) for uri in report.unchanged}
+    # 描画し直せなかったdocsは古い内容を残し、次回のrefreshで再度描画する
+    for uri in report.failed:
+        if uri in bundle:
+            documents[uri] = bundle.get(uri)
+            manifest["entries"][uri] = old_entries.get(uri)
+    documents.update(rendered)
+    manifest["entries"] = {
+        uri: entry for uri, entry in manifest["entries"].items() if uri in documents
+    }
+    bundle.close()
+
+    write_snapshot(output, documents, {"manifest": manifest})
+    report.elapsed_seconds = time.perf_counter() - started
+    logger.info(f"Refreshed {output}: {report.summary()}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Softreefのdocsのsnapshotを作成する")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bake_parser = subparsers.add_parser(
+        "bake", help="全てのdocsを描画してsnapshotを作成する"
+    )
+    bake_parser.add_argument("--output", default="softreef.snapshot")
+    bake_parser.add_argument("--concurrency", type=int, default=4)
+
+    refresh_parser = subparsers.add_parser(
+        "refresh", help="変更されたdocsだけを描画し直してsnapshotを更新する"
+    )
+    refresh_parser.add_argument("path")
+    refresh_parser.add_argument("--output", default=None)
+    refresh_parser.add_argument("--concurrency", type=int, default=4)
+    refresh_parser.add_argument("--report", default=None, help="JSONの報告の出力先")
+
+    info_parser = subparsers.add_parser("info", help="snapshotの内容を表示する")
+    info_parser.add_argument("path")
+
+    args = parser.parse_args()
+    if args.command == "bake":
+        failures = asyncio.run(bake(args.output, args.concurrency))
+        if failures:
+            logger.error(f"Failed to render {len(failures)} documents: {failures}")
+            raise SystemExit(1)
+    elif args.command == "refresh":
+        report = asyncio.run(
+            refresh(args.path, args.output or args.path, args.concurrency)
+        )
+        print(report.summary())
+        for kind in ["added", "changed", "removed", "failed"]:
+            for uri in getattr(report, kind):
+                print(f"{kind:>8} {uri}")
+        if args.report is not None:
+            Path(args.report).write_text(
+                json.dumps(asdict(report), indent=2, ensure_ascii=False)
+            )
+        if report.failed:
+            raise SystemExit(1)
+    elif args.command == "info":
+        bundle = SnapshotBundle(args.path)
+        created_at = time.ctime(bundle.index["created_at"])
+        print(f"{len(bundle)} documents (created at {created_at})")
+        for uri, entry in bundle.entries.items():
+            print(f"{entry['size']:>8} {entry['length']:>8} {uri}")
+
+
+if __name__ == "__main__":
+    main()
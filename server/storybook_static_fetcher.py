@@ -0,0 +1,208 @@
+import os
+import re
+import time
+import logging
+import asyncio
+import hashlib
+import httpx
+from urllib.parse import urlsplit, urlunsplit
+from dotenv import load_dotenv
+
+from storybook_resources import Resource
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("storybook_static_fetcher")
+
+SOFTREEF_STATIC_FAST_PATH = os.getenv("SOFTREEF_STATIC_FAST_PATH", "1") == "1"
+SOFTREEF_STATIC_INDEX_TTL = float(os.getenv("SOFTREEF_STATIC_INDEX_TTL", "300"))
+
+# 描画結果に本文を含まないため、取り除くだけでよいdoc block。
+# ArgTypesやCanvasなどそれ以外のJSXは描画しないと中身が分からないため、ブラウザでの取得に回す
+IGNORED_DOC_BLOCKS = {"Meta", "Title", "Subtitle", "Unstyled"}
+
+JSX_TAG_PATTERN = re.compile(r"</?([A-Z][A-Za-z0-9]*)\b[^>]*>")
+INLINE_CODE_PATTERN = re.compile(r"(`[^`]*`)")
+STATEMENT_END_PATTERN = re.compile(r"""['"][^'"]*['"];?$|;$""")
+
+
+class IncompleteDocsError(ValueError):
+    pass
+
+
+def check_doc_blocks(names: set[str]):
+    dynamic = names - IGNORED_DOC_BLOCKS
+    if dynamic:
+        raise IncompleteDocsError(
+            f"Docs blocks {sorted(dynamic)} need to be rendered in a browser"
+        )
+
+
+def mdx_to_markdown(mdx: str) -> str:
+    """
+    MDXからimport/export文とdoc blockを取り除いてmarkdownにする。
+    描画が必要なdoc blockが含まれる場合はIncompleteDocsErrorを送出する。
+    """
+    lines = []
+    in_fence = False
+    in_statement = False
+    in_tag = False
+    for line in mdx.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+            lines.append(line)
+            continue
+        if in_fence:
+            lines.append(line)
+            continue
+
+        if in_statement:
+            in_statement = not STATEMENT_END_PATTERN.search(stripped)
+            continue
+        if re.match(r"^(import|export)\b", stripped):
+            in_statement = not STATEMENT_END_PATTERN.search(stripped)
+            continue
+        if in_tag:
+            in_tag = ">" not in stripped
+            continue
+        if match := re.match(r"^<([A-Z][A-Za-z0-9]*)\b[^>]*$", stripped):
+            check_doc_blocks({match.group(1)})
+            in_tag = True
+            continue
+
+        parts = INLINE_CODE_PATTERN.split(line)
+        tags = {tag for part in parts[::2] for tag in JSX_TAG_PATTERN.findall(part)}
+        if tags:
+            check_doc_blocks(tags)
+            parts[::2] = [JSX_TAG_PATTERN.sub("", part) for part in parts[::2]]
+            line = "".join(parts)
+            if not line.strip():
+                continue
+        lines.append(line)
+
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
+class StaticStorybook:
+    """
+    deploy済みstorybookの`index.json`とMDXのソースからブラウザを使わずにdocsを取得する。
+    """
+
+    def __init__(
+        self, index_ttl: float = SOFTREEF_STATIC_INDEX_TTL, timeout: float = 10.0
+    ):
+        self.index_ttl = index_ttl
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        self._indexes: dict[str, tuple[float, dict]] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True, timeout=self.timeout
+            )
+        return self._client
+
+    @staticmethod
+    def base_url(resource: Resource) -> str:
+        parts = urlsplit(resource.url)
+        path = parts.path.rsplit("/", 1)[0]
+        return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+    @classmethod
+    def index_url(cls, resource: Resource) -> str:
+        return f"{cls.base_url(resource)}/index.json"
+
+    async def index(self, base_url: str) -> dict:
+        cached = self._indexes.get(base_url)
+        if cached is not None and time.monotonic() - cached[0] < self.index_ttl:
+            return cached[1]
+
+        async with self._lock:
+            cached = self._indexes.get(base_url)
+            if cached is not None and time.monotonic() - cached[0] < self.index_ttl:
+                return cached[1]
+
+            entries = {}
+            for name, key in [("index.json", "entries"), ("stories.json", "stories")]:
+                response = await self.client.get(f"{base_url}/{name}")
+                if response.status_code == 200:
+                    entries = response.json().get(key, {})
+                    break
+            self._indexes[base_url] = (time.monotonic(), entries)
+            return entries
+
+    async def source_hash(self, base_url: str, import_path: str) -> str | None:
+        """
+        `importPath`のソースのsha256。docsの本文だけを変更したdeployでも変わる。
+        """
+        response = await self.client.get(f"{base_url}/{import_path.removeprefix('./')}")
+        if response.status_code != 200:
+            return None
+        return hashlib.sha256(response.content).hexdigest()
+
+    async def preview_hash(self, base_url: str) -> str | None:
+        """
+        previewの`iframe.html`のsha256。buildごとにhashの付いたchunkの名前が変わるため、ソースを取得できないdocsの変更の検知に使う。
+        """
+        response = await self.client.get(f"{base_url}/iframe.html")
+        if response.status_code != 200:
+            return None
+        return hashlib.sha256(response.content).hexdigest()
+
+    async def validator(self, resource: Resource) -> str | None:
+        """
+        docsの変更の検知に使う値。`index.json`はdocsの本文だけを変更したdeployでは変わらないため、
+        `importPath`のソースのhashを使い、取得できない場合はpreviewの`iframe.html`のhashで代用する。
+        """
+        base_url = self.base_url(resource)
+        entry = None
+        if resource.story_id is not None:
+            entry = (await self.index(base_url)).get(resource.story_id)
+        if entry is not None and entry.get("importPath"):
+            source = await self.source_hash(base_url, entry["importPath"])
+            if source is not None:
+                return source
+        return await self.preview_hash(base_url)
+
+    async def markdown(self, resource: Resource) -> str:
+        if resource.story_id is None:
+            return ""
+
+        try:
+            base_url = self.base_url(resource)
+            entry = (await self.index(base_url)).get(resource.story_id)
+            if entry is None:
+                return ""
+
+            import_path = entry.get("importPath", "")
+            if not import_path.endswith(".mdx"):
+                return ""
+
+            response = await self.client.get(
+                f"{base_url}/{import_path.removeprefix('./')}"
+            )
+            if response.status_code != 200:
+                return ""
+            markdown = mdx_to_markdown(response.text)
+            return markdown if markdown.strip() else ""
+        except IncompleteDocsError as e:
+            logger.info(f"{str(e)} ({resource.story_id})")
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(
+                f'Error "{str(e)}" was occurred during fetching static docs '
+                f"({resource.story_id})"
+            )
+        return ""
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+static_storybook = StaticStorybook()